@@ -1,10 +1,11 @@
-from copy import deepcopy
 from math import sqrt, log
-from random import sample, random
+from random import sample, random, Random
+from time import time
 
+import numpy as np
 from numpy.random.mtrand import dirichlet
 
-from NineMenMorris.board import Board
+from NineMenMorris.board import Board, POINTS, POINT_INDEX, ADJACENT, bits, popcount
 from NineMenMorris.moves import Move
 
 
@@ -24,10 +25,10 @@ def miniMax(board: Board, phase, playerId):
     max_val = -2**62
     max_action = None
     for a in board.legal_moves(phase=phase, player=playerId):
-        simulated = deepcopy(board)
-        simulated.do(a, playerId)
-        next_phase, next_player = phase_and_player_after_sim(phase, a, simulated, playerId)
-        mv, val = miniMax(simulated, next_phase, next_player)
+        token = board.do(a, playerId)
+        next_phase, next_player = phase_and_player_after_sim(phase, a, board, playerId)
+        mv, val = miniMax(board, next_phase, next_player)
+        board.undo(token)
         if 1.0-val > max_val:
             max_val = 1.0-val
             max_action = a
@@ -56,6 +57,205 @@ def phase_and_player_after_sim(phase, move, simulated, playerId):
     return next_phase, next_player
 
 
+class _TimeOut(Exception):
+    pass
+
+
+class AlphaBeta:
+    """
+        Depth limited negamax search with alpha-beta pruning and iterative deepening.
+        Searched positions are stored in a transposition table of fixed size, indexed by Zobrist hashes.
+        If two positions share a slot, the one searched deeper is kept (entries of older searches are always replaced).
+        Moves are ordered: best move from the table first, then killer moves, then by the history heuristic.
+    """
+    WIN = 100000
+    EXACT, LOWER, UPPER = 0, 1, 2
+
+    def __init__(self, time_budget=1.0, max_depth=64, tt_size=2 ** 18, seed=0):
+        """
+            :param time_budget: seconds per call
+            :param max_depth: maximal depth of the iterative deepening
+            :param tt_size: number of entries of the transposition table (power of 2)
+            :param seed: seed for the Zobrist keys
+        """
+        assert tt_size > 0 and tt_size & (tt_size - 1) == 0
+        self.time_budget = time_budget
+        self.max_depth = max_depth
+        self.tt_mask = tt_size - 1
+        self.tt = [None for _ in range(tt_size)]
+        self.generation = 0
+        rng = Random(seed)
+        self.zobrist = [[rng.getrandbits(64) for _ in POINTS] for _ in range(2)]
+        self.zobrist_turn = {(phase, player): rng.getrandbits(64)
+                             for phase in ["set", "move", "jump", "take"] for player in [0, 1]}
+        self.killers = []
+        self.history = {}
+        self.nodes = 0
+        self.tt_hits = 0
+        self.tt_probes = 0
+        self.depth_reached = 0
+        self.deadline = None
+
+    def hash(self, board: Board, phase, player):
+        h = self.zobrist_turn[(phase, player)]
+        for p in [0, 1]:
+            for i in bits(board.get_mask(p)):
+                h ^= self.zobrist[p][i]
+        return h
+
+    def child_hash(self, h, move: Move, phase, player, next_phase, next_player):
+        h ^= self.zobrist_turn[(phase, player)] ^ self.zobrist_turn[(next_phase, next_player)]
+        if move.type == "take":
+            return h ^ self.zobrist[1 - player][POINT_INDEX[move.end]]
+        h ^= self.zobrist[player][POINT_INDEX[move.end]]
+        if move.type == "move":
+            h ^= self.zobrist[player][POINT_INDEX[move.start]]
+        return h
+
+    def evaluate(self, board: Board, phase, player):
+        """
+            Static evaluation from the view of player: pieces, closed mulls and free neighbouring points.
+        """
+        own = board.get_mask(player)
+        enemy = board.get_mask(1 - player)
+        empty = board.get_mask(-1)
+        material = popcount(own) - popcount(enemy)
+        if phase == "take":
+            material += 1
+        mulls = len(board.get_mulls(player)) - len(board.get_mulls(1 - player))
+        mobility = 0
+        for i in bits(own):
+            mobility += popcount(ADJACENT[i] & empty)
+        for i in bits(enemy):
+            mobility -= popcount(ADJACENT[i] & empty)
+        return 100 * material + 20 * mulls + 2 * mobility
+
+    def order(self, moves, tt_move, ply):
+        killers = self.killers[ply]
+
+        def score(move):
+            if move == tt_move:
+                return 3 << 40
+            if move == killers[0]:
+                return 2 << 40
+            if move == killers[1]:
+                return 1 << 40
+            return self.history.get(move, 0)
+        moves.sort(key=score, reverse=True)
+        return moves
+
+    def negamax(self, board: Board, phase, player, depth, alpha, beta, ply, h):
+        self.nodes += 1
+        if self.nodes & 255 == 0 and time() > self.deadline:
+            raise _TimeOut()
+        if board.is_terminal(phase, player):
+            if board.winner == board.player_map[player]:
+                return self.WIN - ply
+            return -(self.WIN - ply)
+        if depth <= 0:
+            return self.evaluate(board, phase, player)
+
+        alpha_orig = alpha
+        tt_move = None
+        self.tt_probes += 1
+        entry = self.tt[h & self.tt_mask]
+        if entry is not None and entry[0] == h:
+            self.tt_hits += 1
+            _, e_depth, flag, value, tt_move, _ = entry
+            # mate scores are stored relative to the node
+            if value > self.WIN - 1000:
+                value -= ply
+            elif value < -self.WIN + 1000:
+                value += ply
+            if e_depth >= depth and ply > 0:
+                if flag == self.EXACT:
+                    return value
+                if flag == self.LOWER:
+                    alpha = max(alpha, value)
+                else:
+                    beta = min(beta, value)
+                if alpha >= beta:
+                    return value
+
+        best = -2 ** 62
+        best_move = None
+        for move in self.order(board.legal_moves(phase, player), tt_move, ply):
+            token = board.do(move, player)
+            try:
+                next_phase, next_player = phase_and_player_after_sim(phase, move, board, player)
+                child_h = self.child_hash(h, move, phase, player, next_phase, next_player)
+                # after a mull the same player moves again, therefore no change of perspective
+                if next_player == player:
+                    val = self.negamax(board, next_phase, next_player, depth - 1, alpha, beta, ply + 1, child_h)
+                else:
+                    val = -self.negamax(board, next_phase, next_player, depth - 1, -beta, -alpha, ply + 1, child_h)
+            finally:
+                board.undo(token)
+            if val > best:
+                best = val
+                best_move = move
+            if val > alpha:
+                alpha = val
+            if alpha >= beta:
+                if move != self.killers[ply][0]:
+                    self.killers[ply][1] = self.killers[ply][0]
+                    self.killers[ply][0] = move
+                self.history[move] = self.history.get(move, 0) + depth * depth
+                break
+
+        if best <= alpha_orig:
+            flag = self.UPPER
+        elif best >= beta:
+            flag = self.LOWER
+        else:
+            flag = self.EXACT
+        stored = best
+        if stored > self.WIN - 1000:
+            stored += ply
+        elif stored < -self.WIN + 1000:
+            stored -= ply
+        slot = h & self.tt_mask
+        old = self.tt[slot]
+        if old is None or old[5] != self.generation or depth >= old[1]:
+            self.tt[slot] = (h, depth, flag, stored, best_move, self.generation)
+        if ply == 0:
+            self.root_move = best_move
+        return best
+
+    def __call__(self, board: Board, phase, player):
+        """
+            Iterative deepening until the time budget is used up.
+            :return: best move found, its value from the view of player
+        """
+        self.deadline = time() + self.time_budget
+        self.generation += 1
+        self.nodes = 0
+        self.tt_hits = 0
+        self.tt_probes = 0
+        self.depth_reached = 0
+        self.killers = [[None, None] for _ in range(self.max_depth + 1)]
+        self.history = {}
+        moves = board.legal_moves(phase, player)
+        if len(moves) == 0:
+            return None, -self.WIN
+        best_move = moves[0]
+        best_val = None
+        h = self.hash(board, phase, player)
+        for depth in range(1, self.max_depth + 1):
+            self.root_move = None
+            try:
+                val = self.negamax(board, phase, player, depth, -2 ** 62, 2 ** 62, 0, h)
+            except _TimeOut:
+                break
+            best_move = self.root_move
+            best_val = val
+            self.depth_reached = depth
+            # the game is decided
+            if abs(val) > self.WIN - 1000:
+                break
+        return best_move, best_val
+
+
 class MCTSGuideI:
     def distr(self, state, phase, player, action):
         raise NotImplementedError()
@@ -67,125 +267,225 @@ class MCTSGuideI:
         raise NotImplementedError()
 
 
-class MCTSActionMemory:
-    def __init__(self, guide: MCTSGuideI):
-        self.mem_state = {}
-        self.guide = guide
+PHASES = ["set", "move", "jump", "take"]
 
-    def __setitem__(self, key, value):
-        state, phase, player, action = key
-        self.mem_state[state][phase][player][action] = value
-
-    def __getitem__(self, item):
-        state, phase, player, action = item
-        return self.mem_state[state][phase][player][action]
-
-    def has(self, state, phase, player):
-        if state not in self.mem_state:
-            return False
-        if phase not in self.mem_state[state]:
-            return False
-        if player not in self.mem_state[state][phase][player]:
-            return False
-        return True
-
-    def expand_into(self, state, phase, player):
-        assert not self.has(state, phase, player)
-        cpy = deepcopy(state)
-        self.mem_state[cpy] = {}
-        self.mem_state[cpy][phase] = {}
-        self.mem_state[cpy][phase][player] = {mv: 0.0 for mv in self.guide.possible_moves()}
-        for state in self.mem_state:
-            print(state)
-            print(state not in self.mem_state)
-
-    def reset(self):
-        self.mem_state = {}
 
-    def __str__(self):
-        return str(self.mem_state)
+class MCTSTree:
+    """
+        Search tree stored in flat numpy arrays.
+        Node i owns the edges first_edge[i], ..., first_edge[i] + n_edges[i] - 1, one for each legal move.
+        Edge e has the move moves[e], visit count n[e], sum of values w[e], prior p[e]
+        and the node it leads to child[e] (-1 as long as it was never visited).
+        visits[i] caches the sum of the visit counts of the edges of node i.
+        Nodes also store the position (key), phase and player, so a subtree can be found again and promoted to root.
+    """
+    def __init__(self, node_capacity=1024, edge_capacity=16384):
+        self.node_capacity = node_capacity
+        self.edge_capacity = edge_capacity
+        self.reset()
 
-    def sum(self):
-        entries = 0
-        for state in self.mem_state:
-            for player in self.mem_state[state]:
-                entries += sum(self.mem_state[state][player])
-        return entries
+    def reset(self):
+        self.n_nodes = 0
+        self.n_edges_used = 0
+        self.first_edge = np.zeros(self.node_capacity, dtype=np.int64)
+        self.n_edges = np.zeros(self.node_capacity, dtype=np.int64)
+        self.visits = np.zeros(self.node_capacity)
+        self.key = np.zeros((self.node_capacity, 2), dtype=np.int64)
+        self.phase = np.zeros(self.node_capacity, dtype=np.int8)
+        self.player = np.zeros(self.node_capacity, dtype=np.int8)
+        self.expanded = np.zeros(self.node_capacity, dtype=bool)
+        self.n = np.zeros(self.edge_capacity)
+        self.w = np.zeros(self.edge_capacity)
+        self.p = np.zeros(self.edge_capacity)
+        self.child = np.full(self.edge_capacity, -1, dtype=np.int64)
+        self.moves = []
+
+    @staticmethod
+    def _grow(arr, size, fill=0):
+        grown = np.full((size,) + arr.shape[1:], fill, dtype=arr.dtype)
+        grown[:arr.shape[0]] = arr
+        return grown
+
+    def add_node(self, key, phase, player):
+        if self.n_nodes == self.node_capacity:
+            self.node_capacity *= 2
+            for name in ["first_edge", "n_edges", "visits", "key", "phase", "player", "expanded"]:
+                setattr(self, name, self._grow(getattr(self, name), self.node_capacity))
+        node = self.n_nodes
+        self.n_nodes += 1
+        self.first_edge[node] = 0
+        self.n_edges[node] = 0
+        self.visits[node] = 0
+        self.key[node] = key
+        self.phase[node] = PHASES.index(phase)
+        self.player[node] = player
+        self.expanded[node] = False
+        return node
+
+    def expand(self, node, moves, priors):
+        """
+            Create the edges of a node.
+            :param moves: legal moves in the node
+            :param priors: prior probability of each move
+        """
+        k = len(moves)
+        while self.n_edges_used + k > self.edge_capacity:
+            self.edge_capacity *= 2
+            for name in ["n", "w", "p"]:
+                setattr(self, name, self._grow(getattr(self, name), self.edge_capacity))
+            self.child = self._grow(self.child, self.edge_capacity, fill=-1)
+        start = self.n_edges_used
+        self.first_edge[node] = start
+        self.n_edges[node] = k
+        self.n[start:start + k] = 0
+        self.w[start:start + k] = 0
+        self.p[start:start + k] = priors
+        self.child[start:start + k] = -1
+        self.moves.extend(moves)
+        self.n_edges_used += k
+        self.expanded[node] = True
+
+    def edges(self, node):
+        start = self.first_edge[node]
+        return slice(start, start + self.n_edges[node])
+
+    def node_phase(self, node):
+        return PHASES[self.phase[node]]
+
+    def find(self, root, key, phase, player, max_depth):
+        """
+            Search the subtree of root (breadth first, up to max_depth moves deep) for a node.
+            :return: the node with the given position, phase and player or -1
+        """
+        level = [root]
+        for depth in range(max_depth + 1):
+            for node in level:
+                if tuple(self.key[node]) == tuple(key) and self.node_phase(node) == phase \
+                        and self.player[node] == player:
+                    return node
+            children = [self.child[self.edges(node)] for node in level if self.expanded[node]]
+            if len(children) == 0:
+                break
+            children = np.concatenate(children)
+            level = children[children >= 0]
+        return -1
+
+    def promote(self, root):
+        """
+            Make root the new root (node 0) and free all nodes and edges that are not in its subtree.
+            The statistics of the subtree are kept.
+        """
+        order = [root]
+        i = 0
+        while i < len(order):
+            node = order[i]
+            i += 1
+            if self.expanded[node]:
+                children = self.child[self.edges(node)]
+                order.extend(children[children >= 0].tolist())
+        order = np.array(order, dtype=np.int64)
+        new_index = np.full(self.n_nodes, -1, dtype=np.int64)
+        new_index[order] = np.arange(len(order))
+        old_edges = [np.arange(self.first_edge[node], self.first_edge[node] + self.n_edges[node])
+                     for node in order if self.expanded[node]]
+        old_edges = np.concatenate(old_edges) if len(old_edges) > 0 else np.zeros(0, dtype=np.int64)
+        moves = [self.moves[e] for e in old_edges]
+        n_edges = np.where(self.expanded[order], self.n_edges[order], 0)
+        first_edge = np.concatenate([[0], np.cumsum(n_edges)[:-1]])
+        child = self.child[old_edges]
+        child = np.where(child >= 0, new_index[np.maximum(child, 0)], -1)
+        fields = {"visits": self.visits[order], "key": self.key[order], "phase": self.phase[order],
+                  "player": self.player[order], "expanded": self.expanded[order], "n": self.n[old_edges],
+                  "w": self.w[old_edges], "p": self.p[old_edges]}
+        self.reset()
+        self.n_nodes = len(order)
+        self.n_edges_used = len(old_edges)
+        self.first_edge[:self.n_nodes] = first_edge
+        self.n_edges[:self.n_nodes] = n_edges
+        self.child[:self.n_edges_used] = child
+        self.moves = moves
+        for name, values in fields.items():
+            getattr(self, name)[:len(values)] = values
 
 
 class GuidedMCTS:
     """
         MCTS algorithm with guiding mechanism.
+        The search does and undoes the moves on the board it is given, the statistics are stored in a MCTSTree.
+        The subtree of the position reached after the own move and the answer of the enemy is reused in the next call.
     """
-    def __init__(self, guide: MCTSGuideI, inv_temp=1/50, c=5, simulations=50, alpha=1.8, eps=0.25):
+    def __init__(self, guide: MCTSGuideI, inv_temp=1/50, c=5, simulations=50, alpha=1.8, eps=0.25, reuse_depth=4):
+        """
+            :param reuse_depth: how many moves deep the old tree is searched for the new root (0 = no tree reuse)
+        """
         self.guide = guide
-        self.sum_qs = MCTSActionMemory(guide)
-        self.ns = MCTSActionMemory(guide)
+        self.reuse_depth = reuse_depth
+        self.tree = MCTSTree()
         self.inv_temp = inv_temp
         self.c = c
         self.simulations = simulations
         self.alpha = alpha
         self.eps = eps
-        self.noise = [1.0/len(guide.possible_moves()) for _ in guide.possible_moves()]
-        self.move_to_idx = {mv: i for i, mv in enumerate(guide.possible_moves())}
-
-    def utility(self, state, phase, player, action, is_root=False):
-        sum_q = self.sum_qs[(state, phase, player, action)]
-        p = self.guide.distr(state, phase, player, action)
+        self.noise = None
+        self.all_moves = list(guide.possible_moves())
+        # statistics of the last call
+        self.nodes = 0
+        self.reused_nodes = 0
+        self.root_reused = False
+        self.simulations_done = 0
+
+    def utility(self, node, is_root=False):
+        """
+            :return: utility of all edges of the node
+        """
+        edges = self.tree.edges(node)
+        n = self.tree.n[edges]
+        p = self.tree.p[edges]
         if is_root:
-            noise = self.noise[self.move_to_idx[action]]
-            p = (1 - self.eps) * p + self.eps * noise
-        assert 0 <= p <= 1
-        n = self.ns[(state, phase, player, action)]
-        N = 0
-        for a in state.legal_moves(phase, player):
-            N += self.ns[(state, phase, player, a)]
-        if n == 0:
-            return p * sqrt(N)
-        return sum_q / n + self.c * p * sqrt(N) / (1 + n)
-
-    def selection(self, root, root_phase, player_turn, visited=set(), is_root=False):
+            p = (1 - self.eps) * p + self.eps * self.noise
+        sqrt_N = sqrt(self.tree.visits[node])
+        explored = self.tree.w[edges] / np.maximum(n, 1) + self.c * p * sqrt_N / (1 + n)
+        return np.where(n == 0, p * sqrt_N, explored)
+
+    def selection(self, board, root, player_turn):
         """
-            Selection part
+            Selection part. Does the selected moves on the board, so afterwards the board is in the leaf state.
+            :param board: board in the state of the root node
             :param root: node to start selection
             :param player_turn: current player
-            :return: list of selected nodes and players
+            :return: leaf node, visited nodes, selected edges, tokens to undo the moves on the board
         """
-        if not self.ns.has(root, root_phase, player_turn):
-            return [[root, root_phase, player_turn, None]]
-        max_util = -2 ** 62
-        max_action = None
-        max_state = None
-        max_phase = None
-        max_player = None
-        # select legal move with the maximum utility
-        for a in root.legal_moves(root_phase, player_turn):
-            u = self.utility(root, root_phase, player_turn, a, is_root=is_root)
-            if u > max_util:
-                simulated = deepcopy(root)
-                simulated.do(a, player_turn)
-                # do not visit the same state twice in order to not get into an endless loop
-                if (simulated, player_turn) in visited:
-                    continue
-                max_util = u
-                max_action = a
-                max_state = simulated
-                max_phase, max_player = phase_and_player_after_sim(root_phase, a, simulated, player_turn)
-        # visited.add((deepcopy(root), player_turn))
-        assert max_state is not None
-        return [[root, root_phase, player_turn, max_action]] + self.selection(max_state, max_phase, max_player, visited)
-
-    def expansion(self, leaf, phase, player_turn):
+        node = root
+        nodes = []
+        edges = []
+        tokens = []
+        while self.tree.expanded[node]:
+            # select legal move with the maximum utility
+            edge = self.tree.first_edge[node] + int(np.argmax(self.utility(node, is_root=node == root)))
+            move = self.tree.moves[edge]
+            phase = self.tree.node_phase(node)
+            tokens.append(board.do(move, player_turn))
+            nodes.append(node)
+            edges.append(edge)
+            phase, player_turn = phase_and_player_after_sim(phase, move, board, player_turn)
+            if self.tree.child[edge] == -1:
+                self.tree.child[edge] = self.tree.add_node(board.key(), phase, player_turn)
+            node = self.tree.child[edge]
+        return node, nodes, edges, tokens
+
+    def expansion(self, leaf, node):
         """
-            Expands a leaf node and adds it to the transition memory
-            :param leaf: unexpanded node
-            :param player_turn: current player
-            :return: a child of the node or none
+            Expands a leaf node: adds the edges of all legal moves to the tree
+            :param leaf: board in the state of the node
+            :param node: unexpanded node
         """
+        phase = self.tree.node_phase(node)
+        player_turn = int(self.tree.player[node])
         if leaf.is_terminal(phase, player_turn):
             return
-        self.ns.expand_into(leaf, phase, player_turn)
-        self.sum_qs.expand_into(leaf, phase, player_turn)
+        moves = leaf.legal_moves(phase, player_turn)
+        priors = [self.guide.distr(leaf, phase, player_turn, move) for move in moves]
+        self.tree.expand(node, moves, priors)
 
     def simulation(self, start_node, start_phase, player_turn):
         """
@@ -196,27 +496,23 @@ class GuidedMCTS:
         """
         return self.guide.val(start_node, start_phase, player_turn)
 
-    def backpropagation(self, nodes, value, player_turn):
-        for state, phase, player, move in nodes[:-1]:
-            self.ns[(state, phase, player, move)] += 1
-            if player == player_turn:
-                self.sum_qs[(state, phase, player, move)] += value
-            else:
-                self.sum_qs[(state, phase, player, move)] -= value
-
-    def get_distr(self, board, phase, player):
-        N = 0
-        move_map = {}
-        for move in self.guide.possible_moves():
-            n = pow(self.ns[(board, phase, player, move)], 1/self.inv_temp)
-            move_map[move] = n
-            N += n
-            if move not in board.legal_moves(phase, player):
-                assert n == 0
-        print(move_map)
-        assert N != 0
-        for move in self.guide.possible_moves():
-            move_map[move] *= 1/N
+    def backpropagation(self, nodes, edges, value, player_turn):
+        nodes = np.array(nodes, dtype=np.int64)
+        edges = np.array(edges, dtype=np.int64)
+        self.tree.n[edges] += 1
+        self.tree.w[edges] += np.where(self.tree.player[nodes] == player_turn, value, -value)
+        self.tree.visits[nodes] += 1
+
+    def get_distr(self, root):
+        edges = self.tree.edges(root)
+        n = self.tree.n[edges]
+        assert n.max() > 0
+        # normalize before taking the power, to not overflow
+        n = np.power(n / n.max(), 1 / self.inv_temp)
+        n /= n.sum()
+        move_map = {move: 0.0 for move in self.all_moves}
+        for move, prob in zip(self.tree.moves[edges], n):
+            move_map[move] = prob
         return move_map
 
     def sample(self, d):
@@ -228,37 +524,61 @@ class GuidedMCTS:
                 return a
             u -= d[a]
 
+    def get_root(self, board, phase, player):
+        """
+            Promote the node of the current position to root, if it is in the tree of the last call.
+            Otherwise start a new tree.
+        """
+        if self.tree.n_nodes > 0 and self.reuse_depth > 0:
+            node = self.tree.find(0, board.key(), phase, player, self.reuse_depth)
+            if node != -1:
+                self.tree.promote(node)
+                self.root_reused = True
+                return 0
+        self.root_reused = False
+        self.tree.reset()
+        return self.tree.add_node(board.key(), phase, player)
+
     def __call__(self, board, phase, player):
+        root = self.get_root(board, phase, player)
+        self.reused_nodes = self.tree.n_nodes if self.root_reused else 0
+        self.simulations_done = 0
+        if not self.tree.expanded[root]:
+            self.expansion(board, root)
         # sample noise for the root node
-        self.noise = dirichlet([self.alpha for _ in self.guide.possible_moves()])
+        self.noise = dirichlet([self.alpha for _ in range(self.tree.n_edges[root])])
         for _ in range(self.simulations+1):
-            print("Simulation {}".format(_), end="\r", flush=True)
-            sel_list = self.selection(board, phase, player, is_root=True)
-            self.expansion(sel_list[-1][0], sel_list[-1][1], sel_list[-1][2])
+            leaf, nodes, edges, tokens = self.selection(board, root, player)
+            leaf_phase = self.tree.node_phase(leaf)
+            leaf_player = int(self.tree.player[leaf])
             try:
-                val = self.simulation(sel_list[-1][0], sel_list[-1][1], sel_list[-1][2])
+                self.expansion(board, leaf)
+                val = self.simulation(board, leaf_phase, leaf_player)
             except:
                 continue
-            if sel_list[-1][2] != player:
+            finally:
+                for token in reversed(tokens):
+                    board.undo(token)
+            if leaf_player != player:
                 val = -val
-            print("BACKPROP", len(sel_list))
-            self.backpropagation(sel_list, val, player)
+            self.backpropagation(nodes, edges, val, player)
+            self.simulations_done += 1
+        self.nodes = self.tree.n_nodes - self.reused_nodes
         # sample move from the new distribution
-        dist = self.get_distr(board, phase, player)
+        dist = self.get_distr(root)
         move = self.sample(dist)
         return move, dist
 
     def reset(self):
-        self.ns.reset()
-        self.sum_qs.reset()
+        self.tree.reset()
 
 
 class MCTSGuide(MCTSGuideI):
     def distr(self, state, phase, player, action):
         return 1
 
-    def val(self, state, phase, player, already_copied=False):
-        # simulate:
+    def val(self, state, phase, player):
+        # simulate on the board itself and take the moves back afterwards:
         if state.is_terminal(phase, player):
             if state.winner is None:
                 return 0.0
@@ -266,13 +586,12 @@ class MCTSGuide(MCTSGuideI):
                 return 1.0
             return -1.0
         action = sample(state.legal_moves(phase, player), 1)[0]
-        if not already_copied:
-            simulated = deepcopy(state)
-        else:
-            simulated = state
-        simulated.do(action, player)
-        phase_post, player_post = phase_and_player_after_sim(phase, action, simulated, player)
-        return self.val(simulated, phase_post, player_post, already_copied=True)
+        token = state.do(action, player)
+        try:
+            phase_post, player_post = phase_and_player_after_sim(phase, action, state, player)
+            return self.val(state, phase_post, player_post)
+        finally:
+            state.undo(token)
 
     def possible_moves(self):
         moves = []
@@ -1,6 +1,60 @@
 from NineMenMorris.moves import Move
 
 
+# All 24 points of the board. The position in this list is the bit of the point in the bitboards.
+# The order is the same as the one used by the encodings (see QNetPlayer).
+POINTS = [(r, x, y) for x in range(3) for y in range(3) if x != 1 or y != 1 for r in range(3)]
+POINT_INDEX = {point: i for i, point in enumerate(POINTS)}
+FULL_MASK = (1 << len(POINTS)) - 1
+
+
+def _adjacent(p1, p2):
+    r1, x1, y1 = p1
+    r2, x2, y2 = p2
+    # move in ring
+    if r1 == r2:
+        return abs(x1 - x2) + abs(y1 - y2) == 1
+    # move between rings
+    return abs(r1 - r2) == 1 and x1 == x2 and y1 == y2 and (x1 == 1 or y1 == 1)
+
+
+def _mills():
+    mills = []
+    for r in range(3):
+        for c in [0, 2]:
+            mills.append([(r, c, y) for y in range(3)])
+            mills.append([(r, x, c) for x in range(3)])
+    for x, y in [(1, 0), (0, 1), (2, 1), (1, 2)]:
+        mills.append([(r, x, y) for r in range(3)])
+    # sort by index, so get_mulls returns the mulls in the same order as an enumeration of all triples would
+    mills = [tuple(sorted(mill, key=POINT_INDEX.get)) for mill in mills]
+    return sorted(mills, key=lambda mill: [POINT_INDEX[p] for p in mill])
+
+
+# ADJACENT[i]: bitmask of the neighbours of point i
+ADJACENT = [sum(1 << j for j, q in enumerate(POINTS) if _adjacent(p, q)) for p in POINTS]
+# MILLS[l]: the three points of line l, MILL_MASKS[l]: the same as a bitmask
+MILLS = _mills()
+MILL_MASKS = [sum(1 << POINT_INDEX[p] for p in mill) for mill in MILLS]
+# LINES[i]: the two lines through point i, LINES_MASK[i]: the same as a bitmask over the 16 lines
+LINES = [tuple(l for l, mask in enumerate(MILL_MASKS) if mask >> i & 1) for i in range(len(POINTS))]
+LINES_MASK = [sum(1 << l for l in lines) for lines in LINES]
+
+
+def bits(mask):
+    """
+        Iterate over the indices of the set bits of the mask (ascending).
+    """
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+def popcount(mask):
+    return bin(mask).count("1")
+
+
 class Board:
     """
         The main class in the NineMenMorris. Representation of the Board.
@@ -33,63 +87,75 @@ class Board:
          (2,0,2) ------------------------ (2,1,2) ------------------------ (2,2,2)
 
          Well this was painfull ...
+
+         Internally the board is stored as two 24 bit integers (one per player), bit i is the point POINTS[i].
+         The closed mulls are kept up to date as two 16 bit integers (one per player), bit l is the line MILLS[l].
     """
     def __init__(self, noP=(0, 0), p0=(1, 0), p1=(0, 1)):
         # possible states:
         self.player_map = {-1: noP, 0: p0, 1: p1}
         self.string_rep = {noP: "_", p0: "x", p1: "o"}
 
-        # board is a matrix 3x3x3 of (0,0). 'None' in unnecessary matrix entries.
-        # Board b -> b[r,x,y]
-        # Access by self.board_state[ring][x][y] or self[ring, x, y] with inner ring = 0, middle ring = 1, outer ring = 2.
+        # bitboards of player 0 and player 1. Access a point by self[ring, x, y]
+        # with inner ring = 0, middle ring = 1, outer ring = 2.
         # This is just the beginning board state
-        self.board_state = [[[None if x == 1 and y == 1 else self.player_map[-1] for y in range(3)]
-                             for x in range(3)] for ring in range(3)]
+        self.pieces = [0, 0]
+        # closed mulls of player 0 and player 1
+        self.mulls = [0, 0]
 
     # Where is no player?
     def get_empty_pos(self):
         return self.get_player_pos(-1)
 
+    def get_mask(self, player):
+        """
+            :param player: 0, 1 or -1 (no player)
+            :return: bitmask of the points of the player
+        """
+        if player == -1:
+            return FULL_MASK ^ self.pieces[0] ^ self.pieces[1]
+        return self.pieces[player]
+
     # Where is the specified player? No player is also an option (-1 / "noP")
     def get_player_pos(self, player):
         if player in ["a", "b", "no"]:
             player = {"a": 0, "b": 1, "no": -1}[player]
         assert player in [0, 1, -1]
-        pos = []
-        for x in range(3):
-            for y in range(3):
-                if x == 1 and y == 1:
-                    continue
-                for r in range(3):
-                    #iteration over all legal r,x,y
-                    if self[r, x, y] == self.player_map[player]:
-                        pos.append((r, x, y))
-        return pos
+        return [POINTS[i] for i in bits(self.get_mask(player))]
 
     # this is so that you can call
     # Board : b -> b[r,x,y]
     def __setitem__(self, key, value):
-        r, x, y = key
-        possible = [0, 1, 2]
-        assert x in possible
-        assert y in possible
-        assert r in possible
-        assert x != 1 or y != 1
         if value in ["a", "b", "no"]:
             value = {"a": 0, "b": 1, "no": -1}[value]
         assert value in [0, 1, -1]
-        self.board_state[r][x][y] = self.player_map[value]
+        i = POINT_INDEX[key]
+        bit = 1 << i
+        self.pieces[0] &= ~bit
+        self.pieces[1] &= ~bit
+        if value != -1:
+            self.pieces[value] |= bit
+        self._update_mulls(i)
+
+    # Recheck the two lines through point i
+    def _update_mulls(self, i):
+        for line in LINES[i]:
+            mask = MILL_MASKS[line]
+            for player in [0, 1]:
+                if self.pieces[player] & mask == mask:
+                    self.mulls[player] |= 1 << line
+                else:
+                    self.mulls[player] &= ~(1 << line)
 
     # this is so that you can call
     # Board : b -> b[r,x,y]
     def __getitem__(self, item):
-        r, x, y = item
-        possible = [0, 1, 2]
-        assert x in possible
-        assert y in possible
-        assert r in possible
-        assert x != 1 or y != 1
-        return self.board_state[r][x][y]
+        bit = 1 << POINT_INDEX[item]
+        if self.pieces[0] & bit:
+            return self.player_map[0]
+        if self.pieces[1] & bit:
+            return self.player_map[1]
+        return self.player_map[-1]
 
     # This is so Board b -> str(b) looks fancy (and therefore also print(b))
     def __str__(self):
@@ -127,46 +193,39 @@ class Board:
         assert phase in ["set", "move", "jump", "take"]
         assert player in [0, 1]
         moves = []
+        empty = FULL_MASK ^ self.pieces[0] ^ self.pieces[1]
         if phase == "set":
-            for x in range(3):
-                for y in range(3):
-                    if x == 1 and y == 1:
-                        continue
-                    for r in range(3):
-                        if self[r, x, y] == self.player_map[-1]:
-                            moves.append(Move("set", (r, x, y)))
-        elif phase in ["move", "jump"]:
-            start_vals = []
-            for x in range(3):
-                for y in range(3):
-                    if x == 1 and y == 1:
-                        continue
-                    for r in range(3):
-                        if self[r, x, y] == self.player_map[player]:
-                            start_vals.append((r, x, y))
-            end_vals = []
-            for x in range(3):
-                for y in range(3):
-                    if x == 1 and y == 1:
-                        continue
-                    for r in range(3):
-                        if self[r, x, y] == self.player_map[-1]:
-                            end_vals.append((r, x, y))
-            for start in start_vals:
-                for end in end_vals:
-                    move = Move("move", end, start)
-                    if self.is_legal(move, phase, player):
-                        moves.append(move)
+            for i in bits(empty):
+                moves.append(Move("set", POINTS[i]))
+        elif phase == "move":
+            for start in bits(self.pieces[player]):
+                for end in bits(ADJACENT[start] & empty):
+                    moves.append(Move("move", POINTS[end], POINTS[start]))
+        elif phase == "jump":
+            for start in bits(self.pieces[player]):
+                for end in bits(empty):
+                    moves.append(Move("move", POINTS[end], POINTS[start]))
         elif phase == "take":
-            for x in range(3):
-                for y in range(3):
-                    if x == 1 and y == 1:
-                        continue
-                    for r in range(3):
-                        if self[r, x, y] == self.player_map[1-player]:
-                            moves.append(Move("take", (r, x, y)))
+            for i in bits(self.pieces[1 - player]):
+                moves.append(Move("take", POINTS[i]))
         return moves
 
+    def has_legal_move(self, phase, player):
+        """
+            Same as len(self.legal_moves(phase, player)) > 0, without generating the moves.
+        """
+        empty = FULL_MASK ^ self.pieces[0] ^ self.pieces[1]
+        if phase == "set":
+            return empty != 0
+        if phase == "take":
+            return self.pieces[1 - player] != 0
+        if phase == "jump":
+            return self.pieces[player] != 0 and empty != 0
+        for start in bits(self.pieces[player]):
+            if ADJACENT[start] & empty:
+                return True
+        return False
+
     # Is the given move from the player in the phase legal given the baord state?
     def is_legal(self, move: Move, phase, player):
         # Is it even a move?
@@ -174,15 +233,11 @@ class Board:
         assert player in [0, 1]
         if move is None:
             return False
-        assert move.end[1] in [0, 1, 2]
-        assert move.end[2] in [0, 1, 2]
-        assert move.end[0] in [0, 1, 2]
-        assert move.end[1] != 1 or move.end[2] != 1
+        end = POINT_INDEX.get(move.end)
+        assert end is not None
         if move.type == "move":
-            assert move.start[0] in [0, 1, 2]
-            assert move.start[1] in [0, 1, 2]
-            assert move.start[2] in [0, 1, 2]
-            assert move.start[1] != 1 or move.start[2] != 1
+            start = POINT_INDEX.get(move.start)
+            assert start is not None
 
         enemy = 1 - player
 
@@ -197,101 +252,90 @@ class Board:
         # Its a take move
         if move.type == "take":
             # Has to take an enemies piece
-            if move.end not in self.get_player_pos(enemy):
-                return False
-        else:
-            # Its a move of type set or move.
-            # Therefore the endpoint has to be an empty position.
-            if move.end not in self.get_empty_pos():
-                return False
-            #If its a move/jump move. Therefore the start point has to be your own piece (duh).
-            if move.type == "move" and move.start not in self.get_player_pos(player):
+            return bool(self.pieces[enemy] >> end & 1)
+        # Its a move of type set or move.
+        # Therefore the endpoint has to be an empty position.
+        if (self.pieces[0] | self.pieces[1]) >> end & 1:
+            return False
+        if move.type == "move":
+            # If its a move/jump move. Therefore the start point has to be your own piece (duh).
+            if not self.pieces[player] >> start & 1:
                 return False
             # Its in the move phase. No jumps allowed here.
-            if phase == "move":
-                start_r, start_x, start_y = move.start
-                end_r, end_x, end_y = move.end
-
-                #move in ring
-                if start_r == end_r:
-                    if abs(start_x-end_x) + abs(start_y-end_y) != 1:
-                        return False
-
-                # move between rings
-                elif abs(start_r - end_r) != 1:
-                    return False
-                else:
-                    if start_x != end_x or start_y != end_y:
-                        return False
-                    if start_x != 1 and start_y != 1:
-                        return False
+            if phase == "move" and not ADJACENT[start] >> end & 1:
+                return False
         return True
 
-    # Apply the (legal) move to the current board
+    # Apply the (legal) move to the current board.
+    # Returns a token, with which undo(token) restores the board as it was before the move.
     def do(self, move: Move, player):
+        token = (self.pieces[0], self.pieces[1], self.mulls[0], self.mulls[1])
+        end_idx = POINT_INDEX[move.end]
+        end = 1 << end_idx
         if move.type == "set":
-            self[move.end] = player
-            return
-        if move.type == "take":
-            self[move.end] = -1
-            return
-        if move.type == "move":
-            self[move.start] = -1
-            self[move.end] = player
+            self.pieces[player] |= end
+            self.pieces[1 - player] &= ~end
+        elif move.type == "take":
+            self.pieces[0] &= ~end
+            self.pieces[1] &= ~end
+        elif move.type == "move":
+            start_idx = POINT_INDEX[move.start]
+            start = 1 << start_idx
+            self.pieces[0] &= ~start
+            self.pieces[1] &= ~start
+            self.pieces[player] |= end
+            self.pieces[1 - player] &= ~end
+            self._update_mulls(start_idx)
+        self._update_mulls(end_idx)
+        return token
+
+    # Take back a move. Tokens have to be undone in the reverse order of the moves.
+    def undo(self, token):
+        self.pieces[0], self.pieces[1], self.mulls[0], self.mulls[1] = token
+
+    # Hashable representation of the current position
+    def key(self):
+        return self.pieces[0], self.pieces[1]
 
     # What are the current mulls?
     def get_mulls(self, player):
-        mulls = []
-        pieces = self.get_player_pos(player)
-        for i in range(len(pieces)-2):
-            for j in range(i+1, len(pieces)-1):
-                for k in range(j+1, len(pieces)):
-                    # all different sets of pieces of this player.
-                    p1 = pieces[i]
-                    p2 = pieces[j]
-                    p3 = pieces[k]
-                    # same ring
-                    if p1[0] == p2[0] and p1[0] == p3[0]:
-                        #same x
-                        if p1[1] == p2[1] and p1[1] == p3[1]:
-                            mulls.append((p1, p2, p3))
-                        # same y
-                        elif p1[2] == p2[2] and p1[2] == p3[2]:
-                            mulls.append((p1, p2, p3))
-                    # different ring, but same x and y
-                    elif p1[1] == p2[1] and p1[1] == p3[1] and p1[2] == p2[2] and p1[2] == p3[2]:
-                        # exclude the edges
-                        if p1[1] == 1 or p1[2] == 1:
-                            mulls.append((p1, p2, p3))
-        return mulls
+        return [MILLS[line] for line in bits(self.mulls[player])]
 
     # Is the point part of a mull?
     def in_mull(self, player, point):
-        mulls = self.get_mulls(player)
-        for mull in mulls:
-            if point in mull:
-                return True
-        return False
+        return self.mulls[player] & LINES_MASK[POINT_INDEX[point]] != 0
 
     def is_terminal(self, phase, player):
         assert phase in ["set", "move", "jump", "take"]
         assert player in [0, 1]
         if phase == "set":
             return False
-        if len(self.get_player_pos(0)) <= 2 or len(self.get_player_pos(1)) <= 2:
-            if len(self.get_player_pos(0)) <= 2:
+        if popcount(self.pieces[0]) <= 2 or popcount(self.pieces[1]) <= 2:
+            if popcount(self.pieces[0]) <= 2:
                 self.winner = self.player_map[1]
             else:
                 self.winner = self.player_map[0]
             return True
-        if len(self.legal_moves(phase, player)) == 0:
+        if not self.has_legal_move(phase, player):
             self.winner = self.player_map[1-player]
             return True
         return False
 
     def clear(self):
-        self.board_state = [[[None if x == 1 and y == 1 else self.player_map[-1] for y in range(3)]
-                             for x in range(3)] for ring in range(3)]
+        self.pieces = [0, 0]
+        self.mulls = [0, 0]
+
+    # The maps are never changed, so a copy only has to copy the bitboards.
+    def __deepcopy__(self, memo):
+        cpy = Board.__new__(Board)
+        cpy.__dict__.update(self.__dict__)
+        cpy.pieces = list(self.pieces)
+        cpy.mulls = list(self.mulls)
+        memo[id(self)] = cpy
+        return cpy
+
+    def __copy__(self):
+        return self.__deepcopy__({})
 
     def __eq__(self, other):
         if not isinstance(other, Board):
@@ -302,17 +346,10 @@ class Board:
             return False
         if self.player_map[0] != other.player_map[0]:
             return False
-        for x in range(3):
-            for y in range(3):
-                if x == 1 and y == 1:
-                    continue
-                for r in range(3):
-                    if other[r, x, y] != self[r, x, y]:
-                        return False
-        return True
+        return self.pieces == other.pieces
 
     def __hash__(self):
-        return hash(str(self.board_state))
+        return hash(self.key())
 
     def __ne__(self, other):
         return not self.__eq__(other)
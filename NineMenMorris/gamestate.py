@@ -27,9 +27,9 @@ class Game:
     def getMove(self, player: PlayerI, phase, eps=0.0):
         while True:
             if isinstance(player, NetPlayerI):
-                move = player.get_move(phase, self.board, eps)
+                move = player.timed_move(phase, self.board, eps)
             else:
-                move = player.get_move(phase, self.board)
+                move = player.timed_move(phase, self.board)
             if self.board.is_legal(move, phase, player.playerID):
                 return move
             print(player.playerID, phase, self.board)
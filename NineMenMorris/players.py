@@ -1,12 +1,15 @@
 from pygame.rect import Rect
 
-from NineMenMorris.SearchAlgorithms import MCTS
+from NineMenMorris.SearchAlgorithms import MCTS, AlphaBeta
 from NineMenMorris.board import Board
 from NineMenMorris.moves import Move
+from network_backend.Modules import no_grad
 from network_backend.reinforcement_learning.encodings import QEncoding, VEncoding
+from network_backend.reinforcement_learning.telemetry import MoveTelemetry
 import re
 from random import random, sample
-from copy import deepcopy
+from time import perf_counter
+import numpy as np
 import pygame as pg
 
 
@@ -22,6 +25,7 @@ class PlayerI:
         """
         assert playerID in [0, 1]
         self.playerID = playerID
+        self.telemetry = MoveTelemetry()
 
     def get_move(self, phase, board: Board):
         """
@@ -33,6 +37,38 @@ class PlayerI:
         assert phase in ["set", "move", "jump", "take"]
         raise NotImplementedError()
 
+    def timed_move(self, *args, **kwargs):
+        """
+            get_move with telemetry: records the latency and the counters (see move_counters) of the move.
+            Game calls this instead of get_move.
+        """
+        start = perf_counter()
+        move = self.get_move(*args, **kwargs)
+        self.telemetry.record(perf_counter() - start, **self.move_counters())
+        return move
+
+    def move_counters(self):
+        """
+            Counters of the last move for the telemetry: nodes, simulations, nn_evals, cache_hits, cache_lookups.
+            Overwrite this in players that search or use nets.
+        """
+        return {}
+
+    def avrg_move_time(self):
+        return self.telemetry.avrg_move_time()
+
+    def n_moves(self):
+        return self.telemetry.n_moves()
+
+    def move_stats(self):
+        """
+            :return: number of moves, latency (p50, p95, max, mean), mean/max/total of the counters, cache hit rate
+        """
+        return self.telemetry.summary()
+
+    def reset_telemetry(self):
+        self.telemetry.reset()
+
     def win(self):
         """
             Called when this player wins a game
@@ -101,10 +137,15 @@ class NetPlayerI(PlayerI):
     def __init__(self, net, playerID=0):
         super(NetPlayerI, self).__init__(playerID)
         self.net = net
+        # positions the net evaluated for the last move
+        self.nn_evals = 0
 
     def get_move(self, phase, board: Board, eps=0):
         return super(NetPlayerI, self).get_move(phase, board)
 
+    def move_counters(self):
+        return {"nn_evals": self.nn_evals}
+
     def win(self):
         super(NetPlayerI, self).win()
 
@@ -150,20 +191,18 @@ class QNetPlayer(NetPlayerI):
         super(QNetPlayer, self).__init__(net, playerID)
 
     def get_move(self, phase, board: Board, eps=0.0):
+        self.nn_evals = 0
         legal_moves = board.legal_moves(phase, self.playerID)
         if len(legal_moves) == 0:
             return None
         if random() < eps:
             return sample(legal_moves, 1)[0]
-        max_q = -2 ** 62
-        max_action = None
-        for move in legal_moves:
-            encoded = QEncoding()(move, board, phase, self.playerID)
-            q_val = self.net(encoded)[0][0]
-            if q_val > max_q:
-                max_q = q_val
-                max_action = move
-        return max_action
+        # score all moves with one forward pass
+        self.nn_evals = len(legal_moves)
+        encoded = QEncoding.encode_batch(legal_moves, board, phase, self.playerID)
+        with no_grad(self.net):
+            q_vals = self.net(encoded)[0]
+        return legal_moves[int(np.argmax(q_vals))]
 
     def win(self):
         pass
@@ -210,23 +249,23 @@ class VNetPlayer(NetPlayerI):
         super(VNetPlayer, self).__init__(net, playerID)
 
     def get_move(self, phase, board: Board, eps=0):
+        self.nn_evals = 0
         legal_moves = board.legal_moves(phase, self.playerID)
         if len(legal_moves) == 0:
             return None
         if random() < eps:
             return sample(legal_moves, 1)[0]
-        max_v = -2 ** 62
-        max_action = None
+        self.nn_evals = len(legal_moves)
+        encoded = []
         for move in legal_moves:
             # simulate move:
-            sim_board = deepcopy(board)
-            sim_board.do(move, self.playerID)
-            encoded = VEncoding()(None, sim_board, phase, self.playerID)
-            q_val = self.net(encoded)[0][0]
-            if q_val > max_v:
-                max_v = q_val
-                max_action = move
-        return max_action
+            token = board.do(move, self.playerID)
+            encoded.append(VEncoding.call(None, board, phase, self.playerID))
+            board.undo(token)
+        # score all successor states with one forward pass
+        with no_grad(self.net):
+            v_vals = self.net(np.stack(encoded, axis=1))[0]
+        return legal_moves[int(np.argmax(v_vals))]
 
     def win(self):
         pass
@@ -376,8 +415,38 @@ class MCTSPlayer(PlayerI):
         a, d = self.mcts(board, phase, self.playerID)
         return a
 
+    def move_counters(self):
+        # the cache is the tree of the last move
+        return {"nodes": self.mcts.nodes, "simulations": self.mcts.simulations_done,
+                "cache_hits": int(self.mcts.root_reused), "cache_lookups": 1, "reused_nodes": self.mcts.reused_nodes}
+
     def win(self):
         pass
 
     def end(self, board: Board):
         self.mcts.reset()
+
+
+class AlphaBetaPlayer(PlayerI):
+    """
+        Alpha-beta search with iterative deepening. Returns the best move found within the time budget.
+    """
+    def __init__(self, playerID=0, time_budget=1.0, max_depth=64, tt_size=2 ** 18):
+        """
+            :param time_budget: seconds per move
+            :param max_depth: maximal search depth
+            :param tt_size: number of entries of the transposition table (power of 2)
+        """
+        super(AlphaBetaPlayer, self).__init__(playerID)
+        self.search = AlphaBeta(time_budget=time_budget, max_depth=max_depth, tt_size=tt_size)
+
+    def get_move(self, phase, board: Board):
+        move, val = self.search(board, phase, self.playerID)
+        return move
+
+    def move_counters(self):
+        return {"nodes": self.search.nodes, "cache_hits": self.search.tt_hits,
+                "cache_lookups": self.search.tt_probes, "depth": self.search.depth_reached}
+
+    def win(self):
+        pass
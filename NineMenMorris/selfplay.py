@@ -0,0 +1,155 @@
+import random
+import numpy as np
+from multiprocessing import Process, Queue, Event
+from queue import Empty, Full
+from NineMenMorris.gamestate import Game
+from NineMenMorris.players import QNetPlayer
+from network_backend.Modules import ModuleI
+from network_backend.SharedMemory import SharedParameters
+from network_backend.reinforcement_learning.rewardFunctions import RewardI
+
+
+class TransitionBuffer:
+    """
+        Stands in for the replay memory in the workers. Collects the transitions of one game.
+    """
+    def __init__(self):
+        self.transitions = []
+
+    def add(self, state_prev, phase_prev, action, reward, state_post, phase_post, turn_player=0):
+        self.transitions.append((state_prev, phase_prev, action, reward, state_post, phase_post, turn_player))
+
+    def flush(self):
+        transitions = self.transitions
+        self.transitions = []
+        return transitions
+
+
+def _self_play_worker(seed, net_string, shared, player_classes, reward, eps, max_steps, queue, stop):
+    random.seed(seed)
+    np.random.seed(seed % 2 ** 32)
+    # the architecture is sent once, the weights come from the shared buffer
+    net = ModuleI.fromString(net_string)
+    version = shared.pull(net)
+    buffer = TransitionBuffer()
+    game = Game(run=False, p0=player_classes[0](net, 0), p1=player_classes[1](net, 1), mem=buffer, reward=reward)
+    while not stop.is_set():
+        version = shared.pull(net, version)
+        moves = game.learn(eps, max_steps=max_steps)
+        result = (game.winner.playerID, moves, buffer.flush())
+        while not stop.is_set():
+            try:
+                queue.put(result, timeout=0.1)
+                break
+            except Full:
+                pass
+
+
+class SelfPlayPool:
+    """
+        Runs self-play games of NineMenMorris in n_workers processes. Every worker has its own Game and copy of the
+        net. The weights are shared via SharedParameters, call update_weights after changing the net.
+        The transitions are sent back through a queue, collect adds them to the replay memory of the learner.
+
+        with SelfPlayPool(net, reward, n_workers=4) as pool:
+            for epoch in range(epochs):
+                pool.collect(memory, games=8)
+                ... train net on memory ...
+                pool.update_weights()
+    """
+    def __init__(self, net: ModuleI, reward: RewardI, n_workers=4, eps=0.1, max_steps=300,
+                 player_classes=(QNetPlayer, QNetPlayer), max_queued_games=64, seed=None):
+        """
+            :param net: the net that is trained
+            :param reward: reward function for the transitions
+            :param n_workers: number of processes
+            :param eps: exploration rate of the players
+            :param max_steps: maximum number of moves in one game
+            :param player_classes: the net players for player 0 and player 1, created as cls(net, playerID)
+            :param max_queued_games: the workers wait if that many games are not collected yet
+            :param seed: seed for the workers (random if None)
+        """
+        self.net = net
+        self.reward = reward
+        self.n_workers = n_workers
+        self.eps = eps
+        self.max_steps = max_steps
+        self.player_classes = player_classes
+        self.seed = random.randrange(2 ** 62) if seed is None else seed
+        self.shared = SharedParameters(net)
+        self.max_queued_games = max_queued_games
+        self.queue = Queue(max_queued_games)
+        self.stop_event = Event()
+        self.workers = []
+        self.games = 0
+        self.wins = [0, 0]
+
+    def start(self):
+        assert len(self.workers) == 0
+        self.stop_event.clear()
+        net_string = self.net.toString()
+        for i in range(self.n_workers):
+            worker = Process(target=_self_play_worker,
+                             args=(self.seed + i, net_string, self.shared, self.player_classes, self.reward, self.eps,
+                                   self.max_steps, self.queue, self.stop_event),
+                             daemon=True)
+            worker.start()
+            self.workers.append(worker)
+        return self
+
+    def update_weights(self):
+        """
+            Publish the current weights of the net to the workers. They use them from their next game on.
+        """
+        self.shared.push(self.net)
+
+    def collect(self, mem, games=1, timeout=None, max_games=None):
+        """
+            Add the transitions of finished games to mem.
+            :param mem: replay memory (anything with the add method of ReplayMem)
+            :param games: number of games to wait for. Games that are already finished are added as well.
+            :param timeout: maximum time to wait for one game in seconds
+            :param max_games: maximum number of games added, games + max_queued_games if None. The workers keep
+                producing games while mem.add runs, without a limit collect would not return if they are faster.
+            :return: number of games and transitions added
+        """
+        assert len(self.workers) > 0
+        if max_games is None:
+            max_games = games + self.max_queued_games
+        n_games = 0
+        n_transitions = 0
+        while n_games < max_games:
+            try:
+                if n_games < games:
+                    winner, moves, transitions = self.queue.get(timeout=timeout)
+                else:
+                    winner, moves, transitions = self.queue.get_nowait()
+            except Empty:
+                break
+            for transition in transitions:
+                mem.add(*transition)
+            self.wins[winner] += 1
+            n_games += 1
+            n_transitions += len(transitions)
+        self.games += n_games
+        return n_games, n_transitions
+
+    def close(self):
+        self.stop_event.set()
+        # empty the queue, so that no worker blocks
+        try:
+            while True:
+                self.queue.get_nowait()
+        except Empty:
+            pass
+        for worker in self.workers:
+            worker.join(timeout=5)
+            if worker.is_alive():
+                worker.terminate()
+        self.workers = []
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
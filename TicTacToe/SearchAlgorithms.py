@@ -4,13 +4,16 @@ from random import sample, random
 from numpy.random import dirichlet
 
 
-def miniMax(board, playerId):
+def miniMax(board, playerId, stats=None):
     """
         Basic MiniMax
         :param board: current Board
         :param playerId: player whos turn it is
+        :param stats: if a dictionary is given, stats["nodes"] is increased by the number of visited states
         :return: best move, value of best move
     """
+    if stats is not None:
+        stats["nodes"] = stats.get("nodes", 0) + 1
     if board.is_terminal(playerId):
         if board.winner is None:
             return -1, 0.5
@@ -22,7 +25,7 @@ def miniMax(board, playerId):
     for a in board.legal_moves():
         simulated = deepcopy(board)
         simulated.do(a, playerId)
-        mv, val = miniMax(simulated, 1 - playerId)
+        mv, val = miniMax(simulated, 1 - playerId, stats)
         if 1.0 - val > max_val:
             max_val = 1.0 - val
             max_action = a
@@ -58,6 +61,12 @@ class MCTSActionMemory:
     def reset(self):
         self.mem_state = {}
 
+    def prune(self, board):
+        """
+            Free all states that can not be reached from board anymore.
+        """
+        self.mem_state = {state: mem for state, mem in self.mem_state.items() if state.follows(board)}
+
     def __str__(self):
         return str(self.mem_state)
 
@@ -79,25 +88,56 @@ class MCTSGuideI:
     def possible_moves(self):
         raise NotImplementedError()
 
+    def evaluate_batch(self, states, players):
+        """
+            Evaluate several leaves at once. Overwrite this if the guide can do that faster than one by one.
+            :param states: list of states
+            :param players: list of the players whos turn it is in the states
+            :return: list of values, list of distributions (one probability per possible move)
+        """
+        values = [self.val(state, player) for state, player in zip(states, players)]
+        distributions = [[self.distr(state, player, a) for a in self.possible_moves()]
+                         for state, player in zip(states, players)]
+        return values, distributions
+
 
 class GuidedMCTS:
     """
         MCTS algorithm with guiding mechanism.
+        The statistics of the states that can still be reached are kept from one call to the next.
+
+        With batch_size > 1 the leaves are evaluated in batches: batch_size selections are done one after another,
+        a virtual loss on the selected edges makes the following selections choose other paths.
+        Then all leaves are evaluated with one call of guide.evaluate_batch and the virtual losses are replaced
+        by the real values.
     """
-    def __init__(self, guide: MCTSGuideI, inv_temp=1/50, c=5, simulations=100, alpha=1.8, eps=0.25):
+    def __init__(self, guide: MCTSGuideI, inv_temp=1/50, c=5, simulations=100, alpha=1.8, eps=0.25, batch_size=1,
+                 virtual_loss=1.0):
         self.guide = guide
         self.sum_qs = MCTSActionMemory()
         self.ns = MCTSActionMemory()
+        # prior probabilities of the expanded states (only used with batch_size > 1)
+        self.ps = MCTSActionMemory()
+        self.batch_size = batch_size
+        self.virtual_loss = virtual_loss
         self.inv_temp = inv_temp
         self.c = c
         self.simulations = simulations
         self.alpha = alpha
         self.eps = eps
         self.noise = [len(guide.possible_moves()) for _ in guide.possible_moves()]
+        # statistics of the last call
+        self.nodes = 0
+        self.reused_nodes = 0
+        self.root_reused = False
+        self.simulations_done = 0
 
     def utility(self, state, player, action, is_root=False):
         sum_q = self.sum_qs[(state, player, action)]
-        p = self.guide.distr(state, player, action)
+        if self.ps.has(state, player):
+            p = self.ps[(state, player, action)]
+        else:
+            p = self.guide.distr(state, player, action)
         if is_root:
             p = (1.0 - self.eps) * p + self.eps * self.noise[action]
         assert 0 <= p <= 1
@@ -167,6 +207,42 @@ class GuidedMCTS:
             else:
                 self.sum_qs[(state, player, move)] -= value
 
+    def add_virtual_loss(self, nodes, loss):
+        # the edges count as visited and lost for the player who chose them
+        for state, player, move in nodes[:-1]:
+            self.ns[(state, player, move)] += loss
+            self.sum_qs[(state, player, move)] -= loss
+
+    def batched_simulations(self, board, player, k):
+        """
+            Select k leaves, evaluate them in one batch and do the backpropagation for all of them.
+        """
+        leaves = []
+        # every leaf is evaluated once, even if it is selected more than once in the batch
+        index = {}
+        for _ in range(k):
+            sel_list = self.selection(board, player, is_root=True)
+            self.add_virtual_loss(sel_list, self.virtual_loss)
+            leaves.append(sel_list)
+            index.setdefault((sel_list[-1][0], sel_list[-1][1]), len(index))
+        values, distributions = self.guide.evaluate_batch([leaf for leaf, _ in index],
+                                                          [leaf_player for _, leaf_player in index])
+        for sel_list in leaves:
+            self.add_virtual_loss(sel_list, -self.virtual_loss)
+            leaf, leaf_player = sel_list[-1][0], sel_list[-1][1]
+            i = index[(leaf, leaf_player)]
+            val, distribution = values[i], distributions[i]
+            if not self.ns.has(leaf, leaf_player):
+                self.expansion(leaf, leaf_player)
+                if self.ns.has(leaf, leaf_player):
+                    self.ps.expand_into(leaf, leaf_player)
+                    for i, a in enumerate(self.guide.possible_moves()):
+                        self.ps[(leaf, leaf_player, a)] = distribution[i]
+            if leaf_player != player:
+                val = -val
+            self.backpropagation(sel_list, val, player)
+            self.simulations_done += 1
+
     def get_distr(self, board, player):
         N = 0
         move_map = {}
@@ -191,15 +267,35 @@ class GuidedMCTS:
             u -= d[a]
 
     def __call__(self, board, player):
+        # keep the subtree of the current board only
+        self.ns.prune(board)
+        self.sum_qs.prune(board)
+        self.ps.prune(board)
+        self.reused_nodes = len(self.ns.mem_state)
+        self.root_reused = self.ns.has(board, player)
         # sample noise for the root node
         self.noise = dirichlet([self.alpha for _ in self.guide.possible_moves()])
-        for _ in range(self.simulations+1):
-            sel_list = self.selection(board, player, is_root=True)
-            self.expansion(sel_list[-1][0], sel_list[-1][1])
-            val = self.simulation(sel_list[-1][0], sel_list[-1][1])
-            if sel_list[-1][1] != player:
-                val = -val
-            self.backpropagation(sel_list, val, player)
+        self.simulations_done = 0
+        if self.batch_size > 1:
+            done = 0
+            if not self.ns.has(board, player):
+                # otherwise every selection of the first batch stops at the root
+                self.batched_simulations(board, player, 1)
+                done = 1
+            while done < self.simulations + 1:
+                k = min(self.batch_size, self.simulations + 1 - done)
+                self.batched_simulations(board, player, k)
+                done += k
+        else:
+            for _ in range(self.simulations+1):
+                sel_list = self.selection(board, player, is_root=True)
+                self.expansion(sel_list[-1][0], sel_list[-1][1])
+                val = self.simulation(sel_list[-1][0], sel_list[-1][1])
+                if sel_list[-1][1] != player:
+                    val = -val
+                self.backpropagation(sel_list, val, player)
+                self.simulations_done += 1
+        self.nodes = len(self.ns.mem_state) - self.reused_nodes
         # sample move from the new distribution
         dist = self.get_distr(board, player)
         move = self.sample(dist)
@@ -208,6 +304,7 @@ class GuidedMCTS:
     def reset(self):
         self.ns.reset()
         self.sum_qs.reset()
+        self.ps.reset()
 
 
 class MCTSGuide(MCTSGuideI):
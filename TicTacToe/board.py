@@ -92,6 +92,15 @@ class Board:
             return True
         return False
 
+    def follows(self, other):
+        """
+            Can this board be reached from the other board? (Pieces are never removed in TicTacToe)
+        """
+        for i in range(9):
+            if other[i] != self.player_map[-1] and other[i] != self[i]:
+                return False
+        return True
+
     def clear(self):
         self.board_state = [self.player_map[-1] for _ in range(9)]
 
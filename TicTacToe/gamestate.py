@@ -25,9 +25,9 @@ class Game:
     def getMove(self, player: PlayerI, eps=0.0):
         while True:
             if isinstance(player, NetPlayerI):
-                move = player.get_move(board=self.board, eps=eps)
+                move = player.timed_move(board=self.board, eps=eps)
             else:
-                move = player.get_move(board=self.board)
+                move = player.timed_move(board=self.board)
             if self.board.is_legal(move, player.playerID):
                 return move
             print(player.playerID, self.board)
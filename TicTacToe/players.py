@@ -4,10 +4,13 @@ import numpy as np
 
 from TicTacToe.board import Board
 from random import random, sample
+from time import perf_counter
 import pygame as pg
 
 from TicTacToe.SearchAlgorithms import miniMax, MCTS, MCTSGuideI, GuidedMCTS
+from network_backend.Modules import MultiHeadNetwork, no_grad
 from network_backend.reinforcement_learning.encodings import TTTQEncoding, TTTVEncoding
+from network_backend.reinforcement_learning.telemetry import MoveTelemetry
 
 
 class PlayerI:
@@ -22,12 +25,45 @@ class PlayerI:
             playerID = {"a": 0, "b": 1}[playerID]
         assert playerID in [0, 1]
         self.playerID = playerID
+        self.telemetry = MoveTelemetry()
 
     # This is the method to implement in 'real' player-classes.
     # It takes a board and the NineMenMorris-phase and should in the implementation return a legal move.
     def get_move(self, board: Board):
         raise NotImplementedError()
 
+    def timed_move(self, *args, **kwargs):
+        """
+            get_move with telemetry: records the latency and the counters (see move_counters) of the move.
+            Game calls this instead of get_move.
+        """
+        start = perf_counter()
+        move = self.get_move(*args, **kwargs)
+        self.telemetry.record(perf_counter() - start, **self.move_counters())
+        return move
+
+    def move_counters(self):
+        """
+            Counters of the last move for the telemetry: nodes, simulations, nn_evals, cache_hits, cache_lookups.
+            Overwrite this in players that search or use nets.
+        """
+        return {}
+
+    def avrg_move_time(self):
+        return self.telemetry.avrg_move_time()
+
+    def n_moves(self):
+        return self.telemetry.n_moves()
+
+    def move_stats(self):
+        """
+            :return: number of moves, latency (p50, p95, max, mean), mean/max/total of the counters, cache hit rate
+        """
+        return self.telemetry.summary()
+
+    def reset_telemetry(self):
+        self.telemetry.reset()
+
     # What the player does when it wins. Can change that in players.
     def win(self):
         print("Player {}: I won :)".format(self.playerID))
@@ -40,10 +76,16 @@ class NetPlayerI(PlayerI):
     def __init__(self, net, playerID=0):
         super(NetPlayerI, self).__init__(playerID)
         self.net = net
+        # positions the net evaluated for the last move and their value and distribution (see evaluate)
+        self.nn_evals = 0
+        self.evaluations = {}
 
     def get_move(self, board: Board, eps=0):
         return super(NetPlayerI, self).get_move(board)
 
+    def move_counters(self):
+        return {"nn_evals": self.nn_evals}
+
     def win(self):
         super(NetPlayerI, self).win()
 
@@ -77,21 +119,19 @@ class QNetPlayer(NetPlayerI):
 
     def get_move(self, board: Board, eps=0.0):
         self.moves += 1
+        self.nn_evals = 0
         legal_moves = board.legal_moves()
         if len(legal_moves) == 0:
             return None
         if random() < eps:
             self.rand += 1
             return sample(legal_moves, 1)[0]
-        max_q = -2 ** 62
-        max_action = None
-        for move in legal_moves:
-            encoded = TTTQEncoding()(move, board, None, self.playerID)
-            q_val = self.net(encoded)[0][0]
-            if q_val > max_q:
-                max_q = q_val
-                max_action = move
-        return max_action
+        # score all moves with one forward pass
+        self.nn_evals = len(legal_moves)
+        encoded = TTTQEncoding.encode_batch(legal_moves, board, None, self.playerID)
+        with no_grad(self.net):
+            q_vals = self.net(encoded)[0]
+        return legal_moves[int(np.argmax(q_vals))]
 
     def win(self):
         pass
@@ -191,23 +231,23 @@ class VNetPlayer(NetPlayerI):
         It takes a net: R^18 -> R
     """
     def get_move(self, board: Board, eps=0):
+        self.nn_evals = 0
         legal_moves = board.legal_moves()
         if len(legal_moves) == 0:
             return None
         if random() < eps:
             return sample(legal_moves, 1)[0]
-        max_v = -2 ** 62
-        max_action = None
+        self.nn_evals = len(legal_moves)
+        encoded = []
         for move in legal_moves:
             # simulate move:
             sim_board = deepcopy(board)
             sim_board.do(move, self.playerID)
-            encoded = TTTVEncoding()(None, sim_board, None, self.playerID)
-            v_val = self.net(encoded)[0][0]
-            if v_val > max_v:
-                max_v = v_val
-                max_action = move
-        return max_action
+            encoded.append(TTTVEncoding.call(None, sim_board, None, self.playerID))
+        # score all successor states with one forward pass
+        with no_grad(self.net):
+            v_vals = self.net(np.stack(encoded, axis=1))[0]
+        return legal_moves[int(np.argmax(v_vals))]
 
     def win(self):
         pass
@@ -217,10 +257,18 @@ class MiniMaxPlayer(PlayerI):
     """
         This player runs a straight min max, expanding all possible future states.
     """
+    def __init__(self, playerID=0):
+        super(MiniMaxPlayer, self).__init__(playerID)
+        self.stats = {}
+
     def get_move(self, board: Board):
-        mv, val = miniMax(board, self.playerID)
+        self.stats = {"nodes": 0}
+        mv, val = miniMax(board, self.playerID, self.stats)
         return mv
 
+    def move_counters(self):
+        return self.stats
+
     def win(self):
         pass
 
@@ -234,6 +282,11 @@ class MCTSPlayer(PlayerI):
         a, d = self.mcts(board, self.playerID)
         return a
 
+    def move_counters(self):
+        # the cache are the statistics kept from the last move
+        return {"nodes": self.mcts.nodes, "simulations": self.mcts.simulations_done,
+                "cache_hits": int(self.mcts.root_reused), "cache_lookups": 1, "reused_nodes": self.mcts.reused_nodes}
+
     def win(self):
         pass
 
@@ -242,40 +295,80 @@ class MCTSPlayer(PlayerI):
 
 
 class AlphaZeroPlayer(PlayerI, MCTSGuideI):
-    def __init__(self, net_processing, net_val, net_distr, playerID=0):
+    def __init__(self, net_processing, net_val=None, net_distr=None, playerID=0, batch_size=1):
         """
             Implements the AlphaGoZero algorithm for TicTacToe.
-            :param net_processing: R^18 -> R^n
+            :param net_processing: MultiHeadNetwork with the heads (value, distribution) if net_val and net_distr are None,
+                                   otherwise R^18 -> R^n
             :param net_val: R^n -> R output in [-1, 1]
             :param net_distr: R^n -> R^9 (9 possible moves) output is probability distribution (softmax)
             :param playerID: this players id
+            :param batch_size: number of leaves the MCTS evaluates with one forward pass (1: no virtual loss, as before)
         """
         super(AlphaZeroPlayer, self).__init__()
         self.playerID = playerID
-        self.net_pre = net_processing
-        self.net_val = net_val
-        self.net_distr = net_distr
+        if net_val is None and net_distr is None:
+            assert isinstance(net_processing, MultiHeadNetwork) and len(net_processing.heads) == 2
+            self.net = net_processing
+        else:
+            self.net = MultiHeadNetwork(net_processing, [net_val, net_distr])
         self.encode = TTTVEncoding()
-        self.guidedMCTS = GuidedMCTS(self)
+        self.guidedMCTS = GuidedMCTS(self, batch_size=batch_size)
         self.boards_encountered = set()
         self.data_wo_vals = []
         self.dataset = []
+        # positions the net evaluated for the last move and their value and distribution (see evaluate)
+        self.nn_evals = 0
+        self.evaluations = {}
 
-    def distr(self, state, player, action=None):
+    @property
+    def net_pre(self):
+        return self.net.trunk
+
+    @property
+    def net_val(self):
+        return self.net.heads[0]
+
+    @property
+    def net_distr(self):
+        return self.net.heads[1]
+
+    def evaluate(self, state, player):
+        """
+            Value and distribution of the state, the net is evaluated once per state and search (MCTS asks for the
+            distribution once per legal action).
+        """
         encoded = self.encode(None, state, None, player)
-        intermed = self.net_pre(encoded)
-        distribution = self.net_distr(intermed)
+        key = encoded.tobytes()
+        if key not in self.evaluations:
+            self.nn_evals += 1
+            with no_grad(self.net):
+                value, distribution = self.net(encoded)
+            self.evaluations[key] = (value[0][0], distribution[:, 0])
+        return self.evaluations[key]
+
+    def distr(self, state, player, action=None):
+        _, distribution = self.evaluate(state, player)
         if action is None:
-            return [distribution[i][0] for i in range(distribution.shape[0])]
-        return distribution[action][0]
+            return [distribution[i] for i in range(distribution.shape[0])]
+        return distribution[action]
 
     def val(self, state, player):
-        encoded = self.encode(None, state, None, player)
-        intermed = self.net_pre(encoded)
-        value = self.net_val(intermed)[0][0]
+        value, _ = self.evaluate(state, player)
         return value
 
+    def evaluate_batch(self, states, players):
+        # one forward pass with the encoded states as columns
+        self.nn_evals += len(states)
+        encoded = np.stack([self.encode(None, state, None, player) for state, player in zip(states, players)], axis=1)
+        with no_grad(self.net):
+            values, distributions = self.net(encoded)
+        return list(values[0]), [list(distributions[:, i]) for i in range(distributions.shape[1])]
+
     def get_move(self, board: Board, again=False):
+        self.nn_evals = 0
+        # the net may have been trained since the last move
+        self.evaluations = {}
         action, distr = self.guidedMCTS(board, self.playerID)
         if again:
             print("----------------------------------------------")
@@ -288,6 +381,11 @@ class AlphaZeroPlayer(PlayerI, MCTSGuideI):
     def possible_moves(self):
         return range(9)
 
+    def move_counters(self):
+        mcts = self.guidedMCTS
+        return {"nodes": mcts.nodes, "simulations": mcts.simulations_done, "nn_evals": self.nn_evals,
+                "cache_hits": int(mcts.root_reused), "cache_lookups": 1, "reused_nodes": mcts.reused_nodes}
+
     def end(self, board: Board):
         self.guidedMCTS.reset()
         self.dataset = []
@@ -0,0 +1,680 @@
+"""
+    Benchmark suite for the boards, the encodings, the network backend, the searches and whole games.
+
+    Run from the base folder:
+        python3 evaluation/benchmark.py run -o baseline.json
+        python3 evaluation/benchmark.py run -o current.json --filter nn. --filter optim.
+        python3 evaluation/benchmark.py compare baseline.json current.json --threshold 0.1
+        python3 evaluation/benchmark.py list
+
+    Every benchmark is set up with fixed seeds, warmed up, and then timed in repeat rounds. The number of calls per
+    round is calibrated so that a round takes at least min_time seconds. The results (median, mean, stdev, quartiles
+    of the time per call and the throughput in the unit of the benchmark) are written to a JSON file.
+    compare exits with status 1 if a benchmark got slower than the threshold allows.
+"""
+import pathlib, sys
+import argparse
+import gc
+import json
+import platform
+import random
+import statistics
+import subprocess
+import time
+from copy import deepcopy
+
+import numpy as np
+
+path = pathlib.Path().absolute()
+sys.path.insert(1, str(path))
+
+from NineMenMorris.board import Board, popcount
+from NineMenMorris.SearchAlgorithms import AlphaBeta, MCTS
+from NineMenMorris.gamestate import Game
+from NineMenMorris import players as morris_players
+from TicTacToe.board import Board as TTTBoard
+from TicTacToe.SearchAlgorithms import miniMax, MCTS as TTTMCTS
+from TicTacToe.gamestate import Game as TTTGame
+from TicTacToe import players as ttt_players
+from network_backend.Modules import FullyConnectedNet, SequentialNetwork, LinearLayer, MultiHeadNetwork
+from network_backend.NonLinear import Sigmoid, Tanh, LeakyReLU, Softmax
+from network_backend.Optimizers import SGD, Adam
+from network_backend.Loss import L2Loss
+from network_backend.Precision import get_default_dtype
+from network_backend.reinforcement_learning.encodings import QEncoding, VEncoding, TTTQEncoding, TTTVEncoding
+
+BENCHMARKS = []
+
+
+class Benchmark:
+    """
+        setup(config) builds the inputs and returns a function without arguments. One call of the function is timed,
+        it returns the number of processed items (in unit), e.g. the number of simulations of a MCTS call.
+    """
+    def __init__(self, name, unit, setup):
+        self.name = name
+        self.unit = unit
+        self.setup = setup
+
+
+def benchmark(name, unit):
+    def register(setup):
+        BENCHMARKS.append(Benchmark(name, unit, setup))
+        return setup
+    return register
+
+
+def seed_all(seed):
+    random.seed(seed)
+    np.random.seed(seed)
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# inputs
+
+def morris_phase(board: Board, player, pieces_set):
+    if pieces_set < 18:
+        return "set"
+    if popcount(board.get_mask(player)) == 3:
+        return "jump"
+    return "move"
+
+
+def morris_positions(n, rng):
+    """
+        n positions (board, phase, player) reached by random play, from the set phase to the end of the game.
+    """
+    positions = []
+    while len(positions) < n:
+        board = Board()
+        player = 0
+        pieces_set = 0
+        for _ in range(rng.randrange(60)):
+            phase = morris_phase(board, player, pieces_set)
+            if board.is_terminal(phase, player):
+                break
+            move = rng.choice(board.legal_moves(phase, player))
+            board.do(move, player)
+            if move.type == "set":
+                pieces_set += 1
+            if board.in_mull(player, move.end) and board.get_mask(1 - player) != 0:
+                board.do(rng.choice(board.legal_moves("take", player)), player)
+            player = 1 - player
+        positions.append((board, morris_phase(board, player, pieces_set), player))
+    return positions
+
+
+def ttt_positions(n, rng):
+    positions = []
+    while len(positions) < n:
+        board = TTTBoard()
+        player = 0
+        for _ in range(rng.randrange(7)):
+            if board.is_terminal(player):
+                break
+            board.do(rng.choice(board.legal_moves()), player)
+            player = 1 - player
+        if not board.is_terminal(player):
+            positions.append((board, player))
+    return positions
+
+
+def morris_q_net():
+    return SequentialNetwork([FullyConnectedNet([103, 100, 100, 50, 50, 10], nonLin=Sigmoid()), LinearLayer(10, 1)])
+
+
+def morris_v_net():
+    return SequentialNetwork([FullyConnectedNet([52, 100, 50, 50, 10]), LinearLayer(10, 1)])
+
+
+def ttt_alpha_zero_net():
+    return MultiHeadNetwork(FullyConnectedNet([18, 20, 50]),
+                            [FullyConnectedNet([50, 1], nonLin=LeakyReLU()),
+                             SequentialNetwork([FullyConnectedNet([50, 50], nonLin=LeakyReLU()),
+                                                FullyConnectedNet([50, 9], nonLin=Softmax())])])
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# board
+
+@benchmark("board.legal_moves", "positions")
+def bench_legal_moves(config):
+    positions = morris_positions(64, random.Random(config["seed"]))
+
+    def run():
+        for board, phase, player in positions:
+            board.legal_moves(phase, player)
+        return len(positions)
+    return run
+
+
+@benchmark("board.is_legal", "moves")
+def bench_is_legal(config):
+    rng = random.Random(config["seed"])
+    checks = []
+    for board, phase, player in morris_positions(64, rng):
+        # legal moves and the same moves in the wrong phase
+        for move in board.legal_moves(phase, player):
+            checks.append((board, move, phase, player))
+            checks.append((board, move, rng.choice(["set", "move", "jump", "take"]), player))
+
+    def run():
+        for board, move, phase, player in checks:
+            board.is_legal(move, phase, player)
+        return len(checks)
+    return run
+
+
+@benchmark("board.get_mulls", "positions")
+def bench_get_mulls(config):
+    positions = morris_positions(64, random.Random(config["seed"]))
+
+    def run():
+        for board, phase, player in positions:
+            board.get_mulls(player)
+            board.get_mulls(1 - player)
+        return len(positions)
+    return run
+
+
+@benchmark("board.do_undo", "moves")
+def bench_do_undo(config):
+    moves = [(board, move, player) for board, phase, player in morris_positions(64, random.Random(config["seed"]))
+             for move in board.legal_moves(phase, player)]
+
+    def run():
+        for board, move, player in moves:
+            board.undo(board.do(move, player))
+        return len(moves)
+    return run
+
+
+@benchmark("board.deepcopy", "boards")
+def bench_deepcopy(config):
+    positions = morris_positions(64, random.Random(config["seed"]))
+
+    def run():
+        for board, phase, player in positions:
+            deepcopy(board)
+        return len(positions)
+    return run
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# encodings
+
+def _encoding_benchmark(encoding, batched):
+    def setup(config):
+        moves = [(board, phase, player, board.legal_moves(phase, player))
+                 for board, phase, player in morris_positions(64, random.Random(config["seed"]))]
+        moves = [entry for entry in moves if len(entry[3]) > 0]
+        n = sum(len(entry[3]) for entry in moves)
+        if batched:
+            def run():
+                for board, phase, player, legal in moves:
+                    encoding.encode_batch(legal, board, phase, player)
+                return n
+        else:
+            def run():
+                for board, phase, player, legal in moves:
+                    for move in legal:
+                        encoding(move, board, phase, player)
+                return n
+        return run
+    return setup
+
+
+benchmark("encoding.q", "encodings")(_encoding_benchmark(QEncoding(), False))
+benchmark("encoding.q_batch", "encodings")(_encoding_benchmark(QEncoding(), True))
+benchmark("encoding.v", "encodings")(_encoding_benchmark(VEncoding(), False))
+benchmark("encoding.v_batch", "encodings")(_encoding_benchmark(VEncoding(), True))
+
+
+@benchmark("encoding.ttt_q", "encodings")
+def bench_ttt_q_encoding(config):
+    moves = [(board, player, move) for board, player in ttt_positions(64, random.Random(config["seed"]))
+             for move in board.legal_moves()]
+    encoding = TTTQEncoding()
+
+    def run():
+        for board, player, move in moves:
+            encoding(move, board, None, player)
+        return len(moves)
+    return run
+
+
+@benchmark("encoding.ttt_v", "encodings")
+def bench_ttt_v_encoding(config):
+    positions = ttt_positions(64, random.Random(config["seed"]))
+    encoding = TTTVEncoding()
+
+    def run():
+        for board, player in positions:
+            encoding(None, board, None, player)
+        return len(positions)
+    return run
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# network backend
+
+# layer sizes of the Morris nets
+LAYER_SIZES = [(103, 100), (100, 100), (100, 50), (52, 100), (50, 10)]
+
+
+def _layer_benchmark(lay_in, lay_out, backward):
+    def setup(config):
+        layer = LinearLayer(lay_in, lay_out)
+        x = np.random.rand(lay_in, config["batch_size"]).astype(get_default_dtype())
+        delta = np.random.rand(lay_out, config["batch_size"]).astype(get_default_dtype())
+        layer(x)
+        if backward:
+            def run():
+                layer.backprop(delta)
+                return config["batch_size"]
+        else:
+            def run():
+                layer(x)
+                return config["batch_size"]
+        return run
+    return setup
+
+
+for lay_in, lay_out in LAYER_SIZES:
+    benchmark("nn.linear_{}x{}.forward".format(lay_in, lay_out), "samples")(_layer_benchmark(lay_in, lay_out, False))
+    benchmark("nn.linear_{}x{}.backward".format(lay_in, lay_out), "samples")(_layer_benchmark(lay_in, lay_out, True))
+
+
+def _net_forward_benchmark(eval_mode, batch_size=None):
+    def setup(config):
+        n = config["batch_size"] if batch_size is None else batch_size
+        net = morris_q_net()
+        if eval_mode:
+            net.set_mode("eval")
+        x = np.random.rand(103, n).astype(get_default_dtype())
+
+        def run():
+            net(x)
+            return n
+        return run
+    return setup
+
+
+# eval mode should never be slower than train mode
+benchmark("nn.morris_q_net.forward", "samples")(_net_forward_benchmark(False))
+benchmark("nn.morris_q_net.forward_eval", "samples")(_net_forward_benchmark(True))
+benchmark("nn.morris_q_net.forward_1", "samples")(_net_forward_benchmark(False, 1))
+benchmark("nn.morris_q_net.forward_eval_1", "samples")(_net_forward_benchmark(True, 1))
+
+
+def _train_step_benchmark(flat, workspace):
+    def setup(config):
+        net = morris_q_net()
+        if flat:
+            net.flatten()
+        net.use_workspace(workspace)
+        opt = Adam(net)
+        criterion = L2Loss()
+        x = np.random.rand(103, config["batch_size"]).astype(get_default_dtype())
+        y = np.random.rand(1, config["batch_size"]).astype(get_default_dtype())
+
+        def run():
+            loss, delta = criterion(net(x), y)
+            net.backprop(delta)
+            opt.take_step()
+            return config["batch_size"]
+        return run
+    return setup
+
+
+# the workspace should never be slower than allocating the arrays
+benchmark("nn.morris_q_net.train_step", "samples")(_train_step_benchmark(False, False))
+benchmark("nn.morris_q_net.train_step_workspace", "samples")(_train_step_benchmark(False, True))
+benchmark("nn.morris_q_net.train_step_flat", "samples")(_train_step_benchmark(True, False))
+benchmark("nn.morris_q_net.train_step_flat_workspace", "samples")(_train_step_benchmark(True, True))
+
+
+def _optimizer_benchmark(make_optimizer, flat):
+    def setup(config):
+        net = morris_q_net()
+        if flat:
+            net.flatten()
+        x = np.random.rand(103, config["batch_size"]).astype(get_default_dtype())
+        net.backprop(net(x))
+        opt = make_optimizer(net)
+
+        def run():
+            opt.take_step()
+            return 1
+        return run
+    return setup
+
+
+benchmark("optim.sgd", "steps")(_optimizer_benchmark(lambda net: SGD(net, 0.001), False))
+benchmark("optim.sgd_flat", "steps")(_optimizer_benchmark(lambda net: SGD(net, 0.001), True))
+benchmark("optim.adam", "steps")(_optimizer_benchmark(lambda net: Adam(net), False))
+benchmark("optim.adam_flat", "steps")(_optimizer_benchmark(lambda net: Adam(net), True))
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# searches
+
+@benchmark("search.morris_mcts", "simulations")
+def bench_morris_mcts(config):
+    positions = morris_positions(4, random.Random(config["seed"]))
+    positions = [p for p in positions if not p[0].is_terminal(p[1], p[2])]
+    mcts = MCTS()
+    mcts.simulations = 10 if config["quick"] else 50
+
+    def run():
+        for board, phase, player in positions:
+            mcts.reset()
+            mcts(board, phase, player)
+        return len(positions) * (mcts.simulations + 1)
+    return run
+
+
+@benchmark("search.morris_alphabeta", "nodes")
+def bench_morris_alphabeta(config):
+    positions = morris_positions(4, random.Random(config["seed"]))
+    positions = [p for p in positions if not p[0].is_terminal(p[1], p[2])]
+    # fixed depth instead of a time budget, so that every call searches the same tree
+    search = AlphaBeta(time_budget=10 ** 9, max_depth=2 if config["quick"] else 3, tt_size=2 ** 16)
+
+    def run():
+        nodes = 0
+        for board, phase, player in positions:
+            search.tt = [None for _ in search.tt]
+            search(board, phase, player)
+            nodes += search.nodes
+        return nodes
+    return run
+
+
+@benchmark("search.ttt_mcts", "simulations")
+def bench_ttt_mcts(config):
+    positions = ttt_positions(4, random.Random(config["seed"]))
+    mcts = TTTMCTS()
+
+    def run():
+        for board, player in positions:
+            mcts.reset()
+            mcts(board, player)
+        return len(positions) * (mcts.simulations + 1)
+    return run
+
+
+def ttt_guided_mcts(config, batch_size):
+    positions = ttt_positions(4, random.Random(config["seed"]))
+    player = ttt_players.AlphaZeroPlayer(ttt_alpha_zero_net(), playerID=0, batch_size=batch_size)
+    mcts = player.guidedMCTS
+
+    def run():
+        for board, turn in positions:
+            mcts.reset()
+            mcts(board, turn)
+        return len(positions) * (mcts.simulations + 1)
+    return run
+
+
+@benchmark("search.ttt_guided_mcts", "simulations")
+def bench_ttt_guided_mcts(config):
+    return ttt_guided_mcts(config, 1)
+
+
+@benchmark("search.ttt_guided_mcts_batched", "simulations")
+def bench_ttt_guided_mcts_batched(config):
+    return ttt_guided_mcts(config, 8)
+
+
+@benchmark("search.ttt_minimax", "searches")
+def bench_ttt_minimax(config):
+    # positions with at least three pieces, a search from the empty board takes seconds
+    positions = [(board, player) for board, player in ttt_positions(64, random.Random(config["seed"]))
+                 if len(board.get_empty_pos()) <= 6][:4]
+
+    def run():
+        for board, player in positions:
+            miniMax(board, player)
+        return len(positions)
+    return run
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# games against the random player
+
+MORRIS_PLAYERS = {
+    "random": lambda playerID: morris_players.RandomPlayer(playerID),
+    "qnet": lambda playerID: morris_players.QNetPlayer(morris_q_net(), playerID),
+    "vnet": lambda playerID: morris_players.VNetPlayer(morris_v_net(), playerID),
+    "alphabeta": lambda playerID: morris_players.AlphaBetaPlayer(playerID, time_budget=10 ** 9, max_depth=1),
+    "mcts": lambda playerID: morris_players.MCTSPlayer(playerID),
+}
+
+TTT_PLAYERS = {
+    "random": lambda playerID: ttt_players.RandomPlayer(playerID),
+    "qnet": lambda playerID: ttt_players.QNetPlayer(FullyConnectedNet([27, 27, 27, 1], nonLin=Tanh()), playerID),
+    "vnet": lambda playerID: ttt_players.VNetPlayer(FullyConnectedNet([18, 20, 20, 1], nonLin=Tanh()), playerID),
+    "minimax": lambda playerID: ttt_players.MiniMaxPlayer(playerID),
+    "mcts": lambda playerID: ttt_players.MCTSPlayer(playerID),
+    "alphazero": lambda playerID: ttt_players.AlphaZeroPlayer(ttt_alpha_zero_net(), playerID=playerID),
+}
+
+
+def _morris_game_benchmark(make_player, max_moves):
+    def setup(config):
+        # the random player moves first, so that the search players do not start on an empty board
+        game = Game(run=False, p0=morris_players.RandomPlayer(0), p1=make_player(1))
+        moves = max_moves if not config["quick"] else max_moves // 10
+
+        def run():
+            game.play(max_moves=moves)
+            return 1
+        return run
+    return setup
+
+
+def _ttt_game_benchmark(make_player):
+    def setup(config):
+        game = TTTGame(run=False, p0=ttt_players.RandomPlayer(0), p1=make_player(1))
+
+        def run():
+            game.play()
+            return 1
+        return run
+    return setup
+
+
+for player_name, make_player in MORRIS_PLAYERS.items():
+    benchmark("game.morris.{}".format(player_name), "games")(
+        _morris_game_benchmark(make_player, 20 if player_name == "mcts" else 200))
+for player_name, make_player in TTT_PLAYERS.items():
+    benchmark("game.ttt.{}".format(player_name), "games")(_ttt_game_benchmark(make_player))
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# timing
+
+def time_calls(fn, number):
+    """
+        :return: time of number calls of fn and the number of processed items
+    """
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        items = 0
+        start = time.perf_counter()
+        for _ in range(number):
+            items += fn()
+        return time.perf_counter() - start, items
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+
+def measure(bench: Benchmark, config):
+    """
+        Set up the benchmark with fixed seeds, warm it up and time it in config["repeat"] rounds.
+        :return: statistics of the time per call (seconds) and the throughput (items per second)
+    """
+    seed_all(config["seed"])
+    fn = bench.setup(config)
+    seed_all(config["seed"])
+    for _ in range(config["warmup"]):
+        fn()
+    # calls per round, so that one round takes at least min_time
+    number = 1
+    while True:
+        elapsed, items = time_calls(fn, number)
+        if elapsed >= config["min_time"] or number >= 2 ** 20:
+            break
+        number *= 2 if elapsed == 0 else max(2, min(10, int(config["min_time"] / elapsed) + 1))
+    per_call = []
+    items_per_call = []
+    for _ in range(config["repeat"]):
+        elapsed, items = time_calls(fn, number)
+        per_call.append(elapsed / number)
+        items_per_call.append(items / number)
+    quartiles = statistics.quantiles(per_call, n=4) if len(per_call) > 1 else per_call * 3
+    median = statistics.median(per_call)
+    return {
+        "unit": bench.unit,
+        "calls_per_round": number,
+        "rounds": len(per_call),
+        "median": median,
+        "mean": statistics.mean(per_call),
+        "stdev": statistics.stdev(per_call) if len(per_call) > 1 else 0.0,
+        "min": min(per_call),
+        "max": max(per_call),
+        "q1": quartiles[0],
+        "q3": quartiles[2],
+        "items_per_call": statistics.mean(items_per_call),
+        "throughput": statistics.mean(items_per_call) / median if median > 0 else float("inf"),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, timeout=10).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def selected(filters):
+    if not filters:
+        return list(BENCHMARKS)
+    return [bench for bench in BENCHMARKS if any(f in bench.name for f in filters)]
+
+
+def run(args):
+    config = {
+        "seed": args.seed,
+        "warmup": args.warmup if args.warmup is not None else (1 if args.quick else 2),
+        "repeat": args.repeat if args.repeat is not None else (3 if args.quick else 7),
+        "min_time": args.min_time if args.min_time is not None else (0.01 if args.quick else 0.1),
+        "batch_size": args.batch_size,
+        "quick": args.quick,
+        "dtype": str(get_default_dtype()),
+    }
+    results = {}
+    for bench in selected(args.filter):
+        print("{:<40}".format(bench.name), end="", flush=True)
+        stats = measure(bench, config)
+        results[bench.name] = stats
+        print("{:>12.3f} ms/call {:>14.1f} {}/s".format(stats["median"] * 1e3, stats["throughput"], stats["unit"]))
+    output = {
+        "meta": {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "processor": platform.processor(),
+        },
+        "config": config,
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(output, f, indent=2)
+    print("results written to " + args.output)
+
+
+def compare_results(baseline, current, threshold):
+    """
+        Compares the median time per call of the benchmarks in both result dictionaries.
+        :return: rows (name, baseline median, current median, ratio, status), names of the regressions
+    """
+    rows = []
+    regressions = []
+    for name in sorted(set(baseline["results"]) | set(current["results"])):
+        if name not in current["results"]:
+            rows.append((name, baseline["results"][name]["median"], None, None, "missing"))
+            continue
+        if name not in baseline["results"]:
+            rows.append((name, None, current["results"][name]["median"], None, "new"))
+            continue
+        old = baseline["results"][name]["median"]
+        new = current["results"][name]["median"]
+        ratio = new / old if old > 0 else float("inf")
+        if ratio > 1 + threshold:
+            status = "REGRESSION"
+            regressions.append(name)
+        elif ratio < 1 / (1 + threshold):
+            status = "faster"
+        else:
+            status = "ok"
+        rows.append((name, old, new, ratio, status))
+    return rows, regressions
+
+
+def compare(args):
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    if baseline["config"] != current["config"]:
+        print("warning: the configurations differ")
+    rows, regressions = compare_results(baseline, current, args.threshold)
+    print("{:<40}{:>14}{:>14}{:>9}  {}".format("benchmark", "baseline ms", "current ms", "ratio", "status"))
+    for name, old, new, ratio, status in rows:
+        print("{:<40}{:>14}{:>14}{:>9}  {}".format(name,
+                                                   "-" if old is None else "{:.3f}".format(old * 1e3),
+                                                   "-" if new is None else "{:.3f}".format(new * 1e3),
+                                                   "-" if ratio is None else "{:.2f}".format(ratio),
+                                                   status))
+    if regressions:
+        print("{} regression(s) over {:.0f}%".format(len(regressions), args.threshold * 100))
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks for NineMenMorris, TicTacToe and network_backend")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="run the benchmarks and write the results to a JSON file")
+    run_parser.add_argument("-o", "--output", default="benchmark.json")
+    run_parser.add_argument("-f", "--filter", action="append", help="only benchmarks whose name contains this")
+    run_parser.add_argument("--seed", type=int, default=0)
+    run_parser.add_argument("--warmup", type=int, help="calls before timing")
+    run_parser.add_argument("--repeat", type=int, help="timed rounds")
+    run_parser.add_argument("--min-time", type=float, help="minimal time of a round in seconds")
+    run_parser.add_argument("--batch-size", type=int, default=32, help="batch size of the network benchmarks")
+    run_parser.add_argument("--quick", action="store_true", help="fewer rounds and smaller searches")
+    run_parser.set_defaults(func=run)
+
+    compare_parser = commands.add_parser("compare", help="compare results with a baseline, exit status 1 on regressions")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=0.1, help="allowed slowdown of the median")
+    compare_parser.set_defaults(func=compare)
+
+    list_parser = commands.add_parser("list", help="list the benchmarks")
+    list_parser.add_argument("-f", "--filter", action="append")
+    list_parser.set_defaults(func=lambda args: print("\n".join(bench.name for bench in selected(args.filter))))
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
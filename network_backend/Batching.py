@@ -1,32 +1,99 @@
 import random
 import numpy as np
+from network_backend.Precision import as_float
+
+
+class ArrayBatcher:
+    """
+        Batches over column-major arrays: x has shape (input size, N), every target has shape (target size, N) or (N,).
+        Only an index permutation is shuffled, the batches are gathered lazily. Every batch is a new tuple of arrays,
+        so the batches can be kept (e.g. list(batcher)).
+        With reuse_buffers=True the batches are gathered into output buffers that are reused for every batch instead:
+        every step yields the same arrays, overwritten with the next batch. So use (or copy) a batch before asking
+        for the next one.
+        Internally the points are stored as contiguous rows, so a gather copies whole rows and the batches are
+        transposed arrays of rows.
+        As in SimpleBatcher, the last batch is filled up with random points, so all batches have the same size.
+        Numeric arrays are converted to dtype (the default dtype of Precision if None).
+    """
+    def __init__(self, batch_size, x, *targets, dtype=None, reuse_buffers=False):
+        self.batch_size = batch_size
+        self.reuse_buffers = reuse_buffers
+        # rows[i][j] is point j of array i
+        self.rows = [np.ascontiguousarray(as_float(array, dtype).T) for array in (x,) + targets]
+        self.N = self.rows[0].shape[0]
+        for rows in self.rows:
+            assert rows.ndim <= 2
+            assert rows.shape[0] == self.N
+        self.buffers = None
+
+    @classmethod
+    def from_dataset(cls, batch_size, dataset):
+        """
+            :param dataset: list of tuples (x, y_1, ..., y_k)
+        """
+        assert len(dataset) > 0
+        arrays = [np.array([p[i] for p in dataset]).T for i in range(len(dataset[0]))]
+        return cls(batch_size, *arrays)
+
+    def __len__(self):
+        return self.N
+
+    def permutation(self):
+        n = -(-self.N // self.batch_size) * self.batch_size
+        perm = np.random.permutation(self.N)
+        if n == self.N:
+            return perm
+        # fill up the last batch with random points
+        perm = np.resize(perm, n)
+        np.random.shuffle(perm)
+        return perm
+
+    def __iter__(self):
+        perm = self.permutation()
+        if not self.reuse_buffers:
+            for start in range(0, len(perm), self.batch_size):
+                idx = perm[start:start + self.batch_size]
+                yield tuple(np.take(rows, idx, axis=0).T for rows in self.rows)
+            return
+        if self.buffers is None:
+            self.buffers = [np.empty((self.batch_size,) + rows.shape[1:], dtype=rows.dtype) for rows in self.rows]
+        batch = tuple(buffer.T for buffer in self.buffers)
+        for start in range(0, len(perm), self.batch_size):
+            idx = perm[start:start + self.batch_size]
+            for rows, buffer in zip(self.rows, self.buffers):
+                np.take(rows, idx, axis=0, out=buffer, mode="clip")
+            yield batch
+
+    def subset_percent(self, percent, batch_size=None):
+        assert 0 < percent and percent <= 1
+        idx = np.random.permutation(self.N)[:int(self.N * percent)]
+        if batch_size is None:
+            batch_size = self.batch_size
+        return ArrayBatcher(batch_size, *[rows[idx].T for rows in self.rows], reuse_buffers=self.reuse_buffers)
 
 
 class SimpleBatcher:
+    """
+        Batches over a list of tuples (x, y_1, ..., y_k). Every batch is a new tuple of arrays (see ArrayBatcher).
+        The list is converted to arrays once and again when its length changed (e.g. points were appended).
+        Points that are replaced in place are not noticed.
+    """
     def __init__(self, batch_size, dataset):
         self.batch_size = batch_size
         self.dataset = dataset
+        self.array_batcher = None
 
     def __len__(self):
         return len(self.dataset)
 
     def __iter__(self):
-        shuffeled_data = list(self.dataset)
-        while len(shuffeled_data) < self.batch_size:
-            shuffeled_data += shuffeled_data
-        random.shuffle(shuffeled_data)
-        mod = len(shuffeled_data) % self.batch_size
-        if mod != 0:
-            shuffeled_data += shuffeled_data[:self.batch_size - mod]
-            random.shuffle(shuffeled_data)
-        batched_points = []
-        batch_size = self.batch_size
-        n = int(len(shuffeled_data) / batch_size)
-        for i in range(n):
-            batch_x = [p[0] for p in shuffeled_data[i * batch_size:(i + 1) * batch_size]]
-            batch_y = [p[1] for p in shuffeled_data[i * batch_size:(i + 1) * batch_size]]
-            batched_points.append((np.array(batch_x).T, np.array(batch_y).T))
-        return iter(batched_points)
+        if len(self.dataset) == 0:
+            return iter([])
+        # the dataset is converted to arrays once, the batches are gathered from them
+        if self.array_batcher is None or len(self.array_batcher) != len(self.dataset):
+            self.array_batcher = ArrayBatcher.from_dataset(self.batch_size, self.dataset)
+        return iter(self.array_batcher)
 
     def subset_percent(self, percent, batch_size=None):
         assert 0 < percent and percent <= 1
@@ -35,25 +102,11 @@ class SimpleBatcher:
         length = int(len(self) * percent)
         if batch_size is None:
             batch_size = self.batch_size
-        return SimpleBatcher(batch_size, shuffeled_data[: length])
+        return type(self)(batch_size, shuffeled_data[: length])
 
 
 class TwoGoalBatcher(SimpleBatcher):
-    def __iter__(self):
-        shuffeled_data = list(self.dataset)
-        while len(shuffeled_data) < self.batch_size:
-            shuffeled_data += shuffeled_data
-        random.shuffle(shuffeled_data)
-        mod = len(shuffeled_data) % self.batch_size
-        if mod != 0:
-            shuffeled_data += shuffeled_data[:self.batch_size - mod]
-            random.shuffle(shuffeled_data)
-        batched_points = []
-        batch_size = self.batch_size
-        n = int(len(shuffeled_data) / batch_size)
-        for i in range(n):
-            batch_x = [p[0] for p in shuffeled_data[i * batch_size:(i + 1) * batch_size]]
-            batch_y1 = [p[1] for p in shuffeled_data[i * batch_size:(i + 1) * batch_size]]
-            batch_y2 = [p[2] for p in shuffeled_data[i * batch_size:(i + 1) * batch_size]]
-            batched_points.append((np.array(batch_x).T, np.array(batch_y1).T, np.array(batch_y2).T))
-        return iter(batched_points)
+    """
+        Batcher for datasets of (x, y_1, y_2). Kept for compatibility, SimpleBatcher handles any number of goals.
+    """
+    pass
@@ -23,16 +23,30 @@ class LossI:
     def __call__(self, out, labels):
         return self.loss(out, labels), self.d(out, labels)
 
+    def profile_cost(self, method, args, result):
+        """
+            Estimated floating point operations and allocated bytes of loss or d (see Modules.profile).
+        """
+        out = args[0]
+        result = np.asarray(result)
+        return 3 * out.size, result.nbytes
+
+
+def _labels_like(out, labels):
+    # labels in the dtype of the output, so that no float64 temporaries are created for float32 nets
+    return np.asarray(labels).astype(out.dtype, copy=False)
+
 
 class L2Loss(LossI):
     def loss(self, out, labels):
+        labels = _labels_like(out, labels)
         if len(labels.shape) == 1:
             labels = labels[:, np.newaxis]
-        outer = 1/2 * (labels-out).T@(labels-out)
-        return np.array([outer[i][i] for i in range(outer.shape[0])])
+        # diagonal of 1/2 * (labels-out).T @ (labels-out)
+        return 1/2 * np.sum((labels-out)**2, axis=0)
 
     def d(self, out, labels):
-        return out-labels
+        return out-_labels_like(out, labels)
 
 
 class BCELoss(LossI):
@@ -40,9 +54,11 @@ class BCELoss(LossI):
         self.eps = eps
 
     def loss(self, out, labels):
+        labels = _labels_like(out, labels)
         return -(labels * np.log(out+self.eps) + (1-labels) * np.log(1-out+self.eps))
 
     def d(self, out, labels):
+        labels = _labels_like(out, labels)
         return (1 - labels) / (1 - out + self.eps) - labels / (out + self.eps)
 
 
@@ -54,11 +70,13 @@ class CrossEntropyLoss(LossI):
         self.eps = eps
 
     def loss(self, out, labels):
+        labels = _labels_like(out, labels)
         if len(labels.shape) == 1:
             labels = labels[:, np.newaxis]
         return -np.sum(labels * np.log(out + self.eps), axis=0)
 
     def d(self, out, labels):
+        labels = _labels_like(out, labels)
         if len(labels.shape) == 1:
             labels = labels[:, np.newaxis]
         return out-labels
@@ -1,12 +1,53 @@
 import numpy as np
+from copy import deepcopy
 from network_backend.NonLinear import Sigmoid, ActivationI, fctn_dict, Identity
+from network_backend.Precision import resolve_dtype
 import json
+import struct
+from time import perf_counter
+from math import prod
+
+# eval mode and the workspace use scratch buffers for arrays of at least that many elements, smaller arrays are
+# cheaper to allocate than to look up
+SCRATCH_MIN_SIZE = 2048
+
+# binary checkpoints: magic, length of the json header (little endian uint64), json header, aligned array blobs
+CHECKPOINT_MAGIC = b"NNCKPT01"
+CHECKPOINT_ALIGN = 64
+
+
+class FlatParameters:
+    """
+        All parameters and all gradients of a network in two contiguous arrays.
+        The parameters and gradients of the layers are views into them (see ModuleI.flatten).
+    """
+    def __init__(self, size, dtype=None):
+        self.params = np.zeros(size, dtype=resolve_dtype(dtype))
+        self.grads = np.zeros(size, dtype=resolve_dtype(dtype))
+
+    def split(self, shapes):
+        """
+            :return: views of params and grads with the given shapes (consecutive)
+        """
+        param_views = []
+        grad_views = []
+        offset = 0
+        for shape in shapes:
+            size = int(np.prod(shape))
+            param_views.append(self.params[offset:offset + size].reshape(shape))
+            grad_views.append(self.grads[offset:offset + size].reshape(shape))
+            offset += size
+        return param_views, grad_views
 
 
 class ModuleI:
     # call super().__init__() in subclasses
     def __init__(self):
         self.mode_train = True
+        # eval mode and workspace: one buffer per tag and the views of it per shape, reused by every call
+        self.scratch_buffers = {}
+        self.scratch_views = {}
+        self.workspace = False
 
     # for nicer syntax
     def __call__(self, x):
@@ -33,19 +74,79 @@ class ModuleI:
     def toFile(self, f):
         f.write(self.toString())
 
+    def save(self, path):
+        """
+            Save the module as binary checkpoint: a small json header with the module tree and the raw arrays.
+            Load it with fromFile.
+        """
+        arrays = []
+        tree = self.toDict(arrays)
+        infos = []
+        offset = 0
+        for array in arrays:
+            offset = -(-offset // CHECKPOINT_ALIGN) * CHECKPOINT_ALIGN
+            infos.append({"dtype": array.dtype.str, "shape": list(array.shape), "offset": offset})
+            offset += array.nbytes
+        header = json.dumps({"module": tree, "arrays": infos}).encode()
+        start = -(-(len(CHECKPOINT_MAGIC) + 8 + len(header)) // CHECKPOINT_ALIGN) * CHECKPOINT_ALIGN
+        with open(path, "wb") as f:
+            f.write(CHECKPOINT_MAGIC)
+            f.write(struct.pack("<Q", len(header)))
+            f.write(header)
+            for array, info in zip(arrays, infos):
+                f.write(bytes(start + info["offset"] - f.tell()))
+                f.write(np.ascontiguousarray(array).tobytes())
+
     @classmethod
-    def fromFile(cls, path):
-        with open(path) as f:
+    def fromFile(cls, path, mmap_mode=None):
+        """
+            Load a module saved with save (binary) or toFile (json).
+            :param mmap_mode: for binary checkpoints: None reads the arrays into memory, "r" maps them read-only
+                (processes that only play can share the same pages), "c" maps them copy-on-write
+        """
+        with open(path, "rb") as f:
+            magic = f.read(len(CHECKPOINT_MAGIC))
+            if magic != CHECKPOINT_MAGIC:
+                f.seek(0)
+                for l in f:
+                    return cls.fromString(l.decode())
+            header_len, = struct.unpack("<Q", f.read(8))
+            header = json.loads(f.read(header_len).decode())
+        start = -(-(len(CHECKPOINT_MAGIC) + 8 + header_len) // CHECKPOINT_ALIGN) * CHECKPOINT_ALIGN
+        arrays = []
+        for info in header["arrays"]:
+            dtype = np.dtype(info["dtype"])
+            shape = tuple(info["shape"])
+            if mmap_mode is None:
+                count = int(np.prod(shape))
+                array = np.fromfile(path, dtype=dtype, count=count, offset=start + info["offset"]).reshape(shape)
+            else:
+                array = np.memmap(path, dtype=dtype, mode=mmap_mode, offset=start + info["offset"], shape=shape)
+            arrays.append(array)
+        return cls.fromDict(header["module"], arrays)
+
+    @classmethod
+    def convertFile(cls, json_path, path):
+        """
+            Convert an old json .net file into a binary checkpoint.
+        """
+        with open(json_path) as f:
             for l in f:
-                return cls.fromString(l)
+                # keep the stored precision
+                cls.fromDict(json.loads(l), as_stored=True).save(path)
+                return
 
     @classmethod
     def fromString(cls, str):
         return cls.fromDict(json.loads(str))
 
     @classmethod
-    def fromDict(cls, obj):
-        return class_dict[obj["class_name"]].dict2Mod(obj)
+    def fromDict(cls, obj, arrays=None, as_stored=False):
+        """
+            :param arrays: the arrays of a binary checkpoint (referenced by index in obj)
+            :param as_stored: keep the dtype of the stored arrays instead of using the default dtype
+        """
+        return class_dict[obj["class_name"]].dict2Mod(obj, arrays, as_stored)
 
     def toString(self):
         return json.dumps(self.toDict())
@@ -88,24 +189,129 @@ class ModuleI:
         elif mode in ['test', 'Test', 'eval', 'Eval']:
             self.mode_train = False
 
+    def use_workspace(self, workspace=True):
+        """
+            In training mode, write outputs, deltas and gradients into buffers that grow to the largest batch size
+            and are reused afterwards (arrays smaller than SCRATCH_MIN_SIZE are allocated). The output of the network
+            and the delta returned by backprop are then only valid until the next call of feed_forward / backprop.
+            :return: self
+        """
+        self.workspace = workspace
+        return self
+
+    def scratch(self, shape, dtype, tag="eval"):
+        """
+            Buffer for eval mode and the workspace. There is one buffer per tag, large enough for the largest shape
+            seen so far, and a view of it with the requested shape is returned. So the result of a layer in eval mode
+            is only valid until the next call (SequentialNetwork returns a copy of its output).
+        """
+        # the views are cached, the usual call is one dictionary lookup
+        view = self.scratch_views.get((tag, shape, dtype))
+        if view is not None:
+            return view
+        size = prod(shape)
+        buffer = self.scratch_buffers.get((tag, dtype))
+        if buffer is None or buffer.size < size:
+            buffer = np.empty(size, dtype=dtype)
+            self.scratch_buffers[(tag, dtype)] = buffer
+            # the views of the old buffer are not used anymore
+            self.scratch_views = {key: view for key, view in self.scratch_views.items() if key[0] != tag}
+        view = buffer[:size].reshape(shape)
+        self.scratch_views[(tag, shape, dtype)] = view
+        return view
+
     def getGradients(self):
         """
             :return: Gradients for the last run of backpropagation.
         """
         raise NotImplementedError()
 
-    def toDict(self):
+    def getParameters(self):
         """
+            :return: The parameter arrays (not copies) in the same order as getGradients.
+        """
+        raise NotImplementedError()
+
+    def children(self):
+        """
+            :return: the modules this module consists of
+        """
+        return []
+
+    def profile_cost(self, method, args, result):
+        """
+            Estimate for profile: floating point operations and bytes allocated by the call method(*args) = result.
+            Modules with children return 0, their cost is the sum of the costs of the children.
+            :return: flops, bytes
+        """
+        return 0, 0
+
+    def bindParameters(self, params, grads):
+        """
+            Use the given arrays for the parameters and the gradients from now on.
+            :param params: arrays in the order of getParameters, already containing the current values
+            :param grads: arrays for the gradients, the backpropagation writes into them
+        """
+        assert len(params) == 0 and len(grads) == 0
+
+    def flatten(self, flat=None):
+        """
+            Move all parameters and gradients into one contiguous array each (self.flat).
+            The optimizers then update the whole network with a few vector operations.
+            :param flat: FlatParameters of the right size and dtype to use (e.g. in shared memory), a new one if None
+            :return: self
+        """
+        params = self.getParameters()
+        dtype = np.result_type(*params) if len(params) > 0 else None
+        if flat is None:
+            flat = FlatParameters(sum(param.size for param in params), dtype)
+        assert flat.params.size == sum(param.size for param in params)
+        param_views, grad_views = flat.split([param.shape for param in params])
+        for view, param in zip(param_views, params):
+            view[...] = param
+        self.bindParameters(param_views, grad_views)
+        self.flat = flat
+        return self
+
+    def __deepcopy__(self, memo):
+        cpy = type(self).__new__(type(self))
+        memo[id(self)] = cpy
+        for key, value in self.__dict__.items():
+            # a copy is not profiled
+            if isinstance(value, _ProfiledCall):
+                continue
+            # the flat store is created again below (it may be in shared memory, see Parallel), the scratch buffers
+            # when they are needed
+            if key == "flat":
+                value = None
+            elif key in ["scratch_buffers", "scratch_views"]:
+                value = {}
+            setattr(cpy, key, deepcopy(value, memo))
+        # the copied views do not share memory anymore
+        if getattr(self, "flat", None) is not None:
+            cpy.flatten()
+        return cpy
+
+    # profiled methods are not pickled
+    def __getstate__(self):
+        return {key: value for key, value in self.__dict__.items() if not isinstance(value, _ProfiledCall)}
+
+    def toDict(self, arrays=None):
+        """
+            :param arrays: if a list is given, the parameter arrays are appended to it and only their index is stored
+                in the dictionary (binary checkpoints). Otherwise they are stored as lists.
             :return: The module as a python dictionary. For saving and restoring.
         """
         obj = {"class_name": type(self).__name__}
         return obj
 
     @classmethod
-    def dict2Mod(cls, obj):
+    def dict2Mod(cls, obj, arrays=None, as_stored=False):
         """
             Resore the module from a python dictionary.
             :param obj: dictionary
+            :param arrays: arrays referenced by index in obj (see toDict)
+            :param as_stored: keep the dtype of the stored arrays instead of using the default dtype
             :return: module
         """
         raise NotImplementedError()
@@ -121,8 +327,25 @@ class SequentialNetwork(ModuleI):
     def feed_forward(self, x):
         for layer in self.layers:
             x = layer(x)
+        if not self.mode_train and x.base is not None:
+            # the layers write into their scratch buffers (the output of a nested network is a copy already)
+            return x.copy()
         return x
 
+    def children(self):
+        return self.layers
+
+    def set_mode(self, mode):
+        super(SequentialNetwork, self).set_mode(mode)
+        for layer in self.layers:
+            layer.set_mode(mode)
+
+    def use_workspace(self, workspace=True):
+        super(SequentialNetwork, self).use_workspace(workspace)
+        for layer in self.layers:
+            layer.use_workspace(workspace)
+        return self
+
     def backprop(self, delta_out):
         delta = delta_out
         for layer in reversed(self.layers):
@@ -135,50 +358,173 @@ class SequentialNetwork(ModuleI):
     def getGradients(self):
         return [grad for layer in self.layers for grad in layer.getGradients()]
 
+    def getParameters(self):
+        return [param for layer in self.layers for param in layer.getParameters()]
+
+    def bindParameters(self, params, grads):
+        for layer in self.layers:
+            n = len(layer.getParameters())
+            layer.bindParameters(params[:n], grads[:n])
+            params = params[n:]
+            grads = grads[n:]
+
     def update(self, delta):
         for layer in self.layers:
             layer.update(delta[:len(layer)])
             delta = delta[len(layer):]
 
-    def toDict(self):
+    def toDict(self, arrays=None):
         obj = super(SequentialNetwork, self).toDict()
-        layer_list = [layer.toDict() for layer in self.layers]
+        layer_list = [layer.toDict(arrays) for layer in self.layers]
         obj["layers"] = layer_list
         return obj
 
     @classmethod
-    def dict2Mod(cls, obj):
+    def dict2Mod(cls, obj, arrays=None, as_stored=False):
         layer_list = obj["layers"]
-        layers = [ModuleI.fromDict(lay) for lay in layer_list]
+        layers = [ModuleI.fromDict(lay, arrays, as_stored) for lay in layer_list]
         return SequentialNetwork(layers)
 
 
-def FullyConnectedNet(sizes, nonLin=Sigmoid()):
+class MultiHeadNetwork(ModuleI):
+    """
+        A trunk followed by several heads that all get the output of the trunk.
+        feed_forward returns a tuple with the outputs of the heads, backprop takes a tuple with their deltas.
+        The parameters are the ones of the trunk followed by the ones of the heads, so one optimizer trains all of them.
+    """
+    def __init__(self, trunk, heads):
+        super(MultiHeadNetwork, self).__init__()
+        assert isinstance(trunk, ModuleI)
+        assert len(heads) >= 1
+        for head in heads:
+            assert isinstance(head, ModuleI)
+        self.trunk = trunk
+        self.heads = list(heads)
+
+    def modules(self):
+        return [self.trunk] + self.heads
+
+    def children(self):
+        return self.modules()
+
+    def feed_forward(self, x):
+        intermed = self.trunk(x)
+        return tuple(head(intermed) for head in self.heads)
+
+    def backprop(self, delta_out):
+        assert len(delta_out) == len(self.heads)
+        delta = None
+        for head, delta_head in zip(self.heads, delta_out):
+            delta_in = head.backprop(delta_head)
+            if delta is None:
+                # the sum is accumulated in a buffer of its own
+                if self.workspace:
+                    delta = self.scratch(delta_in.shape, delta_in.dtype, "delta")
+                    delta[...] = delta_in
+                else:
+                    delta = delta_in.copy()
+            else:
+                delta += delta_in
+        return self.trunk.backprop(delta)
+
+    def noFeatures(self):
+        return sum([len(module) for module in self.modules()])
+
+    def getGradients(self):
+        return [grad for module in self.modules() for grad in module.getGradients()]
+
+    def getParameters(self):
+        return [param for module in self.modules() for param in module.getParameters()]
+
+    def bindParameters(self, params, grads):
+        for module in self.modules():
+            n = len(module.getParameters())
+            module.bindParameters(params[:n], grads[:n])
+            params = params[n:]
+            grads = grads[n:]
+
+    def update(self, delta):
+        for module in self.modules():
+            module.update(delta[:len(module)])
+            delta = delta[len(module):]
+
+    def set_mode(self, mode):
+        super(MultiHeadNetwork, self).set_mode(mode)
+        for module in self.modules():
+            module.set_mode(mode)
+
+    def use_workspace(self, workspace=True):
+        super(MultiHeadNetwork, self).use_workspace(workspace)
+        for module in self.modules():
+            module.use_workspace(workspace)
+        return self
+
+    def toDict(self, arrays=None):
+        obj = super(MultiHeadNetwork, self).toDict()
+        obj["trunk"] = self.trunk.toDict(arrays)
+        obj["heads"] = [head.toDict(arrays) for head in self.heads]
+        return obj
+
+    @classmethod
+    def dict2Mod(cls, obj, arrays=None, as_stored=False):
+        trunk = ModuleI.fromDict(obj["trunk"], arrays, as_stored)
+        heads = [ModuleI.fromDict(head, arrays, as_stored) for head in obj["heads"]]
+        return MultiHeadNetwork(trunk, heads)
+
+
+def FullyConnectedNet(sizes, nonLin=Sigmoid(), dtype=None):
     layers = []
     assert len(sizes) >= 2
     for size_in, size_out in zip(sizes[:-1], sizes[1:]):
-        layers.append(LinearLayer(size_in, size_out))
+        layers.append(LinearLayer(size_in, size_out, dtype))
         layers.append(NonLinearLayer(nonLin))
     return SequentialNetwork(layers)
 
 
 class LinearLayer(ModuleI):
-    def __init__(self, lay_in, lay_out):
+    def __init__(self, lay_in, lay_out, dtype=None):
+        """
+            :param dtype: dtype of the parameters, the default dtype (see Precision) if None
+        """
         super(LinearLayer, self).__init__()
-        self.weights = np.random.normal(loc=0.0, scale=0.3, size=(lay_out, lay_in))
-        self.bias = np.zeros(lay_out)
+        dtype = resolve_dtype(dtype)
+        self.weights = np.random.normal(loc=0.0, scale=0.3, size=(lay_out, lay_in)).astype(dtype)
+        self.bias = np.zeros(lay_out, dtype=dtype)
         self.lay_in = lay_in
         self.lay_out = lay_out
+        # gradient buffers of a flattened network (see ModuleI.flatten)
+        self.bound = False
 
     def feed_forward(self, x):
         if len(x.shape) <= 1:
             x = x.reshape((x.shape[0], 1))
-        self.x = x
+        # compute in the dtype of the parameters
+        x = x.astype(self.weights.dtype, copy=False)
+        # no input kept for backprop in eval mode
+        self.x = x if self.mode_train else None
+        if (self.workspace or not self.mode_train) and self.lay_out * x.shape[1] >= SCRATCH_MIN_SIZE:
+            z = np.matmul(self.weights, x, out=self.scratch((self.lay_out, x.shape[1]), x.dtype,
+                                                            "z" if self.mode_train else "eval"))
+            z += self.bias[:, np.newaxis]
+            return z
         z = self.weights @ x + self.bias[:, np.newaxis]
         return z
 
     def backprop(self, delta_out):
-        delta_in = self.weights.T @ delta_out
+        if self.workspace and self.lay_in * delta_out.shape[1] >= SCRATCH_MIN_SIZE:
+            delta_in = np.matmul(self.weights.T, delta_out,
+                                 out=self.scratch((self.lay_in, delta_out.shape[1]), delta_out.dtype, "delta_in"))
+        else:
+            delta_in = self.weights.T @ delta_out
+        if self.workspace and not self.bound:
+            self.der_w = self.scratch(self.weights.shape, self.weights.dtype, "der_w")
+            self.der_b = self.scratch(self.bias.shape, self.bias.dtype, "der_b")
+        if self.bound or self.workspace:
+            # same gradients as getGradients computes, written into the flat buffer / the workspace
+            np.matmul(delta_out, self.x.T, out=self.der_w)
+            np.add.reduce(delta_out, axis=-1, out=self.der_b)
+            self.der_b /= self.der_w.shape[-1]
+            return delta_in
         self.der_b = delta_out
         self.der_w = delta_out @ self.x.T
         return delta_in
@@ -196,19 +542,55 @@ class LinearLayer(ModuleI):
             self.der_b = np.sum(self.der_b, axis=-1)/n
         return [self.der_w, self.der_b]
 
-    def toDict(self):
+    def getParameters(self):
+        return [self.weights, self.bias]
+
+    def profile_cost(self, method, args, result):
+        size = self.lay_in * self.lay_out
+        if method == "update":
+            return size + self.lay_out, 0
+        n = args[0].shape[1] if len(args[0].shape) > 1 else 1
+        if method == "feed_forward":
+            return 2 * size * n + self.lay_out * n, new_bytes(self, result)
+        # delta_in and der_w, the gradients are new arrays if they are not written into buffers
+        nbytes = new_bytes(self, result)
+        if not self.bound and not self.workspace:
+            nbytes += self.der_w.nbytes
+        return 4 * size * n + self.lay_out * n, nbytes
+
+    def bindParameters(self, params, grads):
+        self.weights, self.bias = params
+        self.der_w, self.der_b = grads
+        self.bound = True
+
+    def toDict(self, arrays=None):
         obj = super(LinearLayer, self).toDict()
         obj["lay_in"] = self.lay_in
         obj["lay_out"] = self.lay_out
-        obj["weights"] = self.weights.tolist()
-        obj["bias"] = self.bias.tolist()
+        if arrays is None:
+            obj["weights"] = self.weights.tolist()
+            obj["bias"] = self.bias.tolist()
+        else:
+            obj["weights"] = len(arrays)
+            obj["bias"] = len(arrays) + 1
+            arrays += [self.weights, self.bias]
         return obj
 
     @classmethod
-    def dict2Mod(cls, obj):
+    def dict2Mod(cls, obj, arrays=None, as_stored=False):
         layer = LinearLayer(obj["lay_in"], obj["lay_out"])
-        layer.weights = np.array(obj["weights"])
-        layer.bias = np.array(obj["bias"])
+        weights, bias = obj["weights"], obj["bias"]
+        if arrays is not None:
+            weights, bias = arrays[weights], arrays[bias]
+        elif as_stored:
+            # json stores doubles
+            weights, bias = np.array(weights, dtype=np.float64), np.array(bias, dtype=np.float64)
+        if as_stored:
+            layer.weights, layer.bias = np.asarray(weights), np.asarray(bias)
+        else:
+            # memory maps stay memory maps if the dtype already fits
+            layer.weights = np.asarray(weights).astype(resolve_dtype(), copy=False)
+            layer.bias = np.asarray(bias).astype(resolve_dtype(), copy=False)
         return layer
 
 
@@ -219,10 +601,22 @@ class NonLinearLayer(ModuleI):
         self.nonLin = non_linearity
 
     def feed_forward(self, x):
+        if not self.mode_train:
+            self.y = None
+            if x.size < SCRATCH_MIN_SIZE:
+                return self.nonLin(x)
+            return self.nonLin(x, out=self.scratch(x.shape, x.dtype))
+        if self.workspace and x.size >= SCRATCH_MIN_SIZE:
+            self.y = self.nonLin(x, out=self.scratch(x.shape, x.dtype, "y"))
+            return self.y
         self.y = self.nonLin(x)
         return self.y
 
     def backprop(self, delta_out):
+        if self.workspace and self.y.size >= SCRATCH_MIN_SIZE:
+            delta_in = self.nonLin.d(self.y, out=self.scratch(self.y.shape, self.y.dtype, "delta_in"))
+            delta_in *= delta_out
+            return delta_in
         return self.nonLin.d(self.y) * delta_out
 
     def noFeatures(self):
@@ -234,13 +628,25 @@ class NonLinearLayer(ModuleI):
     def getGradients(self):
         return []
 
-    def toDict(self):
+    def getParameters(self):
+        return []
+
+    def profile_cost(self, method, args, result):
+        if method == "feed_forward":
+            return result.size, new_bytes(self, result)
+        if method == "backprop":
+            # derivative and product, the derivative is a temporary array without the workspace
+            temporary = 0 if self.workspace and result.size >= SCRATCH_MIN_SIZE else result.nbytes
+            return 2 * result.size, new_bytes(self, result) + temporary
+        return 0, 0
+
+    def toDict(self, arrays=None):
         obj = super(NonLinearLayer, self).toDict()
         obj["non_linearity"] = self.nonLin.toDict()
         return obj
 
     @classmethod
-    def dict2Mod(cls, obj):
+    def dict2Mod(cls, obj, arrays=None, as_stored=False):
         return NonLinearLayer(ActivationI.fromDict(obj["non_linearity"]))
 
 
@@ -306,22 +712,233 @@ class SplitNonLinearLayer(ModuleI):
     def getGradients(self):
         return []
 
-    def toDict(self):
+    def getParameters(self):
+        return []
+
+    def profile_cost(self, method, args, result):
+        if method in ["feed_forward", "backprop"]:
+            # the parts and their concatenation
+            return result.size, 2 * result.nbytes
+        return 0, 0
+
+    def toDict(self, arrays=None):
         obj = super(SplitNonLinearLayer, self).toDict()
         obj["sizes"] = self.sizes
         obj["non_linearities"] = [non_lin.toDict() for non_lin in self.non_linearities]
         return obj
 
     @classmethod
-    def dict2Mod(cls, obj):
+    def dict2Mod(cls, obj, arrays=None, as_stored=False):
         sizes = obj["sizes"]
         non_lins = [ActivationI.fromDict(non_lin) for non_lin in obj["non_linearities"]]
         return SplitNonLinearLayer(sizes, non_lins)
 
 
+class no_grad:
+    """
+        Run networks in eval mode: no inputs or outputs are kept for backprop and the layers reuse their buffers.
+        The previous modes are restored afterwards.
+
+            with no_grad(net):
+                q_vals = net(encoded)
+    """
+    def __init__(self, *nets):
+        self.nets = nets
+        self.modes = None
+
+    def __enter__(self):
+        self.modes = [net.mode_train for net in self.nets]
+        for net in self.nets:
+            net.set_mode("eval")
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        for net, mode_train in zip(self.nets, self.modes):
+            net.set_mode("train" if mode_train else "eval")
+
+
+def new_bytes(module, result):
+    """
+        Bytes of the arrays in result (array or tuple of arrays) that were allocated by the call, i.e. own their data
+        (the scratch buffers of the modules are returned as views).
+    """
+    arrays = result if isinstance(result, tuple) else (result,)
+    nbytes = 0
+    for array in arrays:
+        if isinstance(array, np.ndarray) and array.flags.owndata:
+            nbytes += array.nbytes
+    return nbytes
+
+
+class ProfileRecord:
+    """
+        Statistics of one method of one profiled object.
+    """
+    def __init__(self, name, kind, method, depth):
+        self.name = name
+        self.kind = kind
+        self.method = method
+        self.depth = depth
+        self.calls = 0
+        self.time = 0.0
+        self.flops = 0
+        self.bytes = 0
+        # records of the same method of the child modules
+        self.children = []
+
+    def total_flops(self):
+        return self.flops + sum(child.total_flops() for child in self.children)
+
+    def total_bytes(self):
+        return self.bytes + sum(child.total_bytes() for child in self.children)
+
+    def toDict(self):
+        return {"name": self.name, "type": self.kind, "method": self.method, "calls": self.calls,
+                "time": self.time, "time_per_call": self.time / self.calls if self.calls > 0 else 0.0,
+                "flops": self.total_flops(), "bytes": self.total_bytes(),
+                "flops_per_s": self.total_flops() / self.time if self.time > 0 else 0.0}
+
+
+class _ProfiledCall:
+    """
+        Replaces a method of one instance while it is profiled.
+    """
+    def __init__(self, record, obj, method):
+        self.record = record
+        self.obj = obj
+        self.method = method
+        self.function = getattr(obj, method)
+
+    def __call__(self, *args, **kwargs):
+        start = perf_counter()
+        result = self.function(*args, **kwargs)
+        self.record.time += perf_counter() - start
+        self.record.calls += 1
+        cost = getattr(self.obj, "profile_cost", None)
+        if cost is not None:
+            flops, nbytes = cost(self.method, args, result)
+            self.record.flops += flops
+            self.record.bytes += nbytes
+        return result
+
+
+class profile:
+    """
+        Records calls, wall time, estimated floating point operations and allocated bytes of modules (feed_forward,
+        backprop and update of every layer), optimizers (take_step) and losses (loss and d).
+        The methods of the given instances are replaced while the profile is attached and restored afterwards, so
+        nothing is measured and nothing costs time when no profile is attached.
+        Times of modules with children include the times of the children.
+
+            with profile(net, opt, criterion) as prof:
+                ... train ...
+            print(prof)
+            rows = prof.report()
+    """
+    MODULE_METHODS = ["feed_forward", "backprop", "update"]
+    OPTIMIZER_METHODS = ["take_step"]
+    LOSS_METHODS = ["loss", "d"]
+
+    def __init__(self, *objects, names=None):
+        """
+            :param objects: modules, optimizers and losses
+            :param names: names of the objects in the report, their class names if None
+        """
+        self.objects = objects
+        self.names = names if names is not None else [type(obj).__name__ for obj in objects]
+        assert len(self.names) == len(self.objects)
+        self.records = []
+        self.wrapped = []
+
+    def _wrap(self, obj, name, methods, depth):
+        records = {}
+        for method in methods:
+            record = ProfileRecord(name, describe(obj), method, depth)
+            records[method] = record
+            self.records.append(record)
+            # the same object given twice is only measured once
+            if isinstance(obj.__dict__.get(method), _ProfiledCall):
+                continue
+            setattr(obj, method, _ProfiledCall(record, obj, method))
+            self.wrapped.append((obj, method))
+        return records
+
+    def _wrap_module(self, module, name, depth):
+        records = self._wrap(module, name, self.MODULE_METHODS, depth)
+        for i, child in enumerate(module.children()):
+            child_records = self._wrap_module(child, "{}.{}".format(name, i), depth + 1)
+            for method in self.MODULE_METHODS:
+                records[method].children.append(child_records[method])
+        return records
+
+    def attach(self):
+        assert len(self.wrapped) == 0
+        self.records = []
+        for obj, name in zip(self.objects, self.names):
+            if isinstance(obj, ModuleI):
+                self._wrap_module(obj, name, 0)
+            elif hasattr(obj, "take_step"):
+                self._wrap(obj, name, self.OPTIMIZER_METHODS, 0)
+            else:
+                self._wrap(obj, name, self.LOSS_METHODS, 0)
+        return self
+
+    def detach(self):
+        for obj, method in self.wrapped:
+            if isinstance(obj.__dict__.get(method), _ProfiledCall):
+                del obj.__dict__[method]
+        self.wrapped = []
+        return self
+
+    def reset(self):
+        for record in self.records:
+            record.calls = 0
+            record.time = 0.0
+            record.flops = 0
+            record.bytes = 0
+
+    def report(self, include_unused=False):
+        """
+            :return: list with a dictionary per profiled method (name, type, method, calls, time, time_per_call,
+                flops, bytes, flops_per_s), ordered like the modules. Times in seconds.
+        """
+        return [record.toDict() for record in self.records if include_unused or record.calls > 0]
+
+    def __str__(self):
+        lines = ["{:<40}{:<14}{:>9}{:>12}{:>11}{:>11}{:>9}{:>10}".format(
+            "name", "method", "calls", "total ms", "ms/call", "MFLOP", "GFLOP/s", "MB")]
+        for record in self.records:
+            if record.calls == 0:
+                continue
+            row = record.toDict()
+            name = "  " * record.depth + "{} {}".format(record.name, record.kind)
+            lines.append("{:<40}{:<14}{:>9}{:>12.3f}{:>11.4f}{:>11.2f}{:>9.2f}{:>10.2f}".format(
+                name[:39], record.method, row["calls"], row["time"] * 1e3, row["time_per_call"] * 1e3,
+                row["flops"] / 1e6, row["flops_per_s"] / 1e9, row["bytes"] / 2 ** 20))
+        return "\n".join(lines)
+
+    def __enter__(self):
+        return self.attach()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.detach()
+
+
+def describe(obj):
+    """
+        Short description of a module, optimizer or loss for reports.
+    """
+    if isinstance(obj, LinearLayer):
+        return "LinearLayer({}, {})".format(obj.lay_in, obj.lay_out)
+    if isinstance(obj, NonLinearLayer):
+        return "NonLinearLayer({})".format(type(obj.nonLin).__name__)
+    return type(obj).__name__
+
+
 class_dict = {
     "LinearLayer": LinearLayer,
     "SequentialNetwork": SequentialNetwork,
+    "MultiHeadNetwork": MultiHeadNetwork,
     "NonLinearLayer": NonLinearLayer,
     #"ResidualLayer": ResidualLayer,
     "SplitNonLinearLayer": SplitNonLinearLayer
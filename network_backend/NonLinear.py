@@ -2,22 +2,28 @@ import numpy as np
 
 
 class ActivationI:
-    def call(self, x):
+    """
+        Activations work elementwise on arrays of any shape (softmax: per column).
+        Pass out to write the result into an existing array, out may also be the input itself.
+    """
+    def call(self, x, out=None):
         """
             :param x: x
+            :param out: optional array for the result
             :return: f(x)
         """
         raise NotImplementedError()
 
-    def d(self, y):
+    def d(self, y, out=None):
         """
             :param y: y = f(x)
+            :param out: optional array for the result
             :return: f'(x)
         """
         raise NotImplementedError()
 
-    def __call__(self, x):
-        return self.call(x)
+    def __call__(self, x, out=None):
+        return self.call(x, out)
 
     def toDict(self):
         obj = {"name": type(self).__name__}
@@ -32,33 +38,29 @@ class ActivationI:
 
 
 class Sigmoid(ActivationI):
-    def call(self, x):
-        return 1/(1 + np.exp(-x))
-
-    def d(self, x):
-        return x * (1 - x)
-
-
-def elementWiseReLU(x, alpha=0.0):
-    return max(x, alpha*x)
-
+    def call(self, x, out=None):
+        # 1/(1 + exp(-x)) for x >= 0 and exp(x)/(1 + exp(x)) for x < 0, so exp never overflows
+        negative = x < 0
+        e = np.exp(-np.abs(x))
+        out = np.add(1.0, e, out=out)
+        np.divide(1.0, out, out=out)
+        np.multiply(out, e, out=out, where=negative)
+        return out
 
-def elementWiseReLUDer(x, alpha=0.0):
-    if x > 0:
-        return 1.0
-    return alpha
+    def d(self, x, out=None):
+        # 1 - x is a temporary, so that x may be out
+        return np.multiply(x, 1.0 - x, out=out)
 
 
 class ReLU(ActivationI):
-    def __init__(self):
-        self.f = np.vectorize(elementWiseReLU)
-        self.df = np.vectorize(elementWiseReLUDer)
+    def call(self, x, out=None):
+        return np.maximum(x, 0.0, out=out)
 
-    def call(self, x):
-        return self.f(x)
-
-    def d(self, x):
-        return self.df(x)
+    def d(self, x, out=None):
+        if out is None:
+            out = np.empty_like(x)
+        out[...] = x > 0
+        return out
 
 
 class LeakyReLU(ActivationI):
@@ -66,19 +68,18 @@ class LeakyReLU(ActivationI):
         assert rate != 1.0
         self.rate = rate
 
-        def func(x):
-            return elementWiseReLU(x, rate)
-        self.f = np.vectorize(func)
-
-        def deriv(x):
-            return elementWiseReLUDer(x, rate)
-        self.df = np.vectorize(deriv)
-
-    def call(self, x):
-        return self.f(x)
+    def call(self, x, out=None):
+        # max(x, rate * x), the multiplication is done first so that x may be out
+        scaled = x * self.rate
+        return np.maximum(x, scaled, out=out)
 
-    def d(self, x):
-        return self.df(x)
+    def d(self, x, out=None):
+        if out is None:
+            out = np.empty_like(x)
+        positive = x > 0
+        out.fill(self.rate)
+        out[positive] = 1.0
+        return out
 
     def toDict(self):
         obj = super(LeakyReLU, self).toDict()
@@ -93,31 +94,44 @@ class LeakyReLU(ActivationI):
 
 
 class Identity(ActivationI):
-    def call(self, x):
-        return x
+    def call(self, x, out=None):
+        if out is None:
+            return x
+        out[...] = x
+        return out
 
-    def d(self, x):
-        return np.ones_like(x)
+    def d(self, x, out=None):
+        if out is None:
+            return np.ones_like(x)
+        out.fill(1.0)
+        return out
 
 
 class Tanh(ActivationI):
-    def call(self, x):
-        return np.tanh(x)
-        
-    def d(self, x):
-        return 1-x*x
+    def call(self, x, out=None):
+        return np.tanh(x, out=out)
+
+    def d(self, x, out=None):
+        out = np.multiply(x, x, out=out)
+        return np.subtract(1.0, out, out=out)
 
 
 class Softmax(ActivationI):
     """
         ONLY USE AS OUTPUT INTO CROSS ENTROPY LOSS
     """
-    def call(self, x):
-        exps = np.exp(x - np.max(x))
-        return exps / np.sum(exps, axis=0)
-
-    def d(self, x):
-        return np.ones_like(x)
+    def call(self, x, out=None):
+        # subtract the maximum of every column, so exp never overflows and no column underflows completely
+        out = np.subtract(x, np.max(x, axis=0, keepdims=True), out=out)
+        np.exp(out, out=out)
+        out /= np.sum(out, axis=0, keepdims=True)
+        return out
+
+    def d(self, x, out=None):
+        if out is None:
+            return np.ones_like(x)
+        out.fill(1.0)
+        return out
 
 
 fctn_dict = {
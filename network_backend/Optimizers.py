@@ -3,6 +3,10 @@ import numpy as np
 
 
 class OptimizerI:
+    # estimates for profile: operations per parameter and temporary arrays of the size of the parameters per step
+    FLOPS_PER_PARAMETER = 0
+    TEMPORARIES_PER_STEP = 0
+
     def __init__(self, net):
         """
             :param net: neural network to be optimized
@@ -10,22 +14,51 @@ class OptimizerI:
         assert isinstance(net, ModuleI)
         self.net = net
 
+    def flat(self):
+        """
+            :return: the flat parameter store of the net or None (see ModuleI.flatten)
+        """
+        return getattr(self.net, "flat", None)
+
     def take_step(self):
         """
             Take one step towards the optimum based on previous backpropagation
         """
         raise NotImplementedError()
 
+    def profile_cost(self, method, args, result):
+        """
+            Estimated floating point operations and allocated bytes of one step (see Modules.profile).
+        """
+        params = self.net.getParameters()
+        flops = self.FLOPS_PER_PARAMETER * sum(param.size for param in params)
+        if self.flat() is not None:
+            # the flat steps work on buffers allocated once
+            return flops, 0
+        return flops, self.TEMPORARIES_PER_STEP * sum(param.nbytes for param in params)
+
 
 class SGD(OptimizerI):
     """
         The classic Optimizer is also the simplest: Vanilla stochastic gradient descent
     """
+    FLOPS_PER_PARAMETER = 2
+    TEMPORARIES_PER_STEP = 1
+
     def __init__(self, net, rate):
         super().__init__(net)
         self.rate = rate
+        # scratch buffer for the flat parameter store
+        self.step = None
 
     def take_step(self):
+        flat = self.flat()
+        if flat is not None:
+            if self.step is None:
+                self.step = np.empty_like(flat.params)
+            np.multiply(flat.grads, self.rate, out=self.step)
+            flat.params -= self.step
+            return
         gradients = self.net.getGradients()
         delta = [self.rate * grad for grad in gradients]
         self.net.update(delta)
@@ -44,6 +77,9 @@ class Adam(OptimizerI):
 
         For further explanation see https://arxiv.org/pdf/1412.6980.pdf
     """
+    FLOPS_PER_PARAMETER = 14
+    TEMPORARIES_PER_STEP = 13
+
     def __init__(self, net, alpha=0.001, beta_1=0.9, beta_2=0.999, eps=10e-8):
         super(Adam, self).__init__(net)
         self.alpha = alpha
@@ -53,14 +89,44 @@ class Adam(OptimizerI):
         # don't initialize the first moment m and second moment v, yet
         self.m = None
         self.v = None
+        # scratch buffers for the flat parameter store
+        self.tmp = None
+        self.step = None
+
+    def take_flat_step(self, flat):
+        # the same computation as below, but in place on the flat buffers
+        if self.m is None:
+            self.m = np.zeros_like(flat.grads)
+            self.v = np.zeros_like(flat.grads)
+            self.tmp = np.empty_like(flat.grads)
+            self.step = np.empty_like(flat.grads)
+        g, m, v, tmp, step = flat.grads, self.m, self.v, self.tmp, self.step
+        m *= self.beta_1
+        np.multiply(g, 1 - self.beta_1, out=tmp)
+        m += tmp
+        v *= self.beta_2
+        np.multiply(g, g, out=tmp)
+        tmp *= 1 - self.beta_2
+        v += tmp
+        # step = alpha * m_bias_corrected / (sqrt(v_bias_corrected) + eps)
+        np.multiply(v, 1/(1 - self.beta_2), out=tmp)
+        np.sqrt(tmp, out=tmp)
+        tmp += self.eps
+        np.multiply(m, self.alpha/(1 - self.beta_1), out=step)
+        step /= tmp
+        flat.params -= step
 
     def take_step(self):
+        flat = self.flat()
+        if flat is not None:
+            self.take_flat_step(flat)
+            return
         # take care: when dealing with np arrays '*' and '/' are pointwise operations. '@' is the matrix multiplication
         gradients = self.net.getGradients()
         if self.m is None:
             # initialize with zeros
-            self.m = [np.zeros(grad.shape) for grad in gradients]
-            self.v = [np.zeros(grad.shape) for grad in gradients]
+            self.m = [np.zeros_like(grad) for grad in gradients]
+            self.v = [np.zeros_like(grad) for grad in gradients]
         self.m = [self.beta_1 * m_i + (1 - self.beta_1) * grad for m_i, grad in zip(self.m, gradients)]
         gradients_squared = [grad*grad for grad in gradients]
         self.v = [self.beta_2 * v_i + (1 - self.beta_2) * grad_sq for v_i, grad_sq in zip(self.v, gradients_squared)]
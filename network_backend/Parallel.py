@@ -0,0 +1,240 @@
+import os
+import numpy as np
+from multiprocessing import Process, RawArray, RawValue, Barrier
+from threading import BrokenBarrierError
+from network_backend.Modules import ModuleI, FlatParameters
+from network_backend.Loss import LossI
+from network_backend.Optimizers import OptimizerI
+from network_backend.Precision import resolve_dtype
+
+
+def _typecode(dtype):
+    return 'f' if np.dtype(dtype) == np.float32 else 'd'
+
+
+class SharedFlatParameters(FlatParameters):
+    """
+        FlatParameters in shared memory: one parameter array for all processes and one gradient slot per process.
+        attach(slot) selects the gradient slot this process writes into.
+    """
+    def __init__(self, size, dtype=None, slots=1):
+        self.size = size
+        self.slots = slots
+        self.dtype = resolve_dtype(dtype)
+        self.param_buffer = RawArray(_typecode(self.dtype), size)
+        self.grad_buffer = RawArray(_typecode(self.dtype), size * slots)
+        self.attach(0)
+
+    def attach(self, slot):
+        self.slot = slot
+        self.params = np.frombuffer(self.param_buffer, dtype=self.dtype)
+        self.grads = self.slot_grads(slot)
+
+    def slot_grads(self, slot):
+        return np.frombuffer(self.grad_buffer, dtype=self.dtype)[slot * self.size:(slot + 1) * self.size]
+
+    # the buffers are passed to the processes, the numpy views are created again
+    def __getstate__(self):
+        return self.size, self.slots, self.dtype, self.param_buffer, self.grad_buffer, self.slot
+
+    def __setstate__(self, state):
+        self.size, self.slots, self.dtype, self.param_buffer, self.grad_buffer, slot = state
+        self.attach(slot)
+
+
+class _SharedArray:
+    """
+        numpy array of fixed shape in shared memory, passed to the processes when they are created.
+    """
+    def __init__(self, shape, dtype):
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.buffer = RawArray(_typecode(self.dtype), int(np.prod(self.shape)))
+
+    def array(self):
+        return np.frombuffer(self.buffer, dtype=self.dtype).reshape(self.shape)
+
+
+def _data_parallel_worker(slot, net_string, flat, loss, x_shared, y_shared, shard_sizes, losses, stop,
+                          start_barrier, done_barrier, workspace):
+    try:
+        net = ModuleI.fromString(net_string)
+        # the replica uses the shared parameters and its own gradient slot, nothing is copied
+        flat.attach(slot)
+        net.bindParameters(*flat.split([param.shape for param in net.getParameters()]))
+        net.flat = flat
+        net.use_workspace(workspace)
+        x_buffer = x_shared.array()[slot]
+        y_buffer = y_shared.array()[slot]
+        while True:
+            start_barrier.wait()
+            if stop.value:
+                break
+            n = shard_sizes[slot]
+            if n > 0:
+                out = net(x_buffer[:, :n])
+                loss_shard, delta = loss(out, y_buffer[..., :n])
+                net.backprop(delta)
+                losses[slot] = float(np.sum(loss_shard))
+            else:
+                flat.grads[...] = 0
+                losses[slot] = 0.0
+            done_barrier.wait()
+    except BrokenBarrierError:
+        pass
+    except BaseException:
+        # let the trainer know instead of leaving it waiting
+        start_barrier.abort()
+        done_barrier.abort()
+        raise
+
+
+class DataParallelTrainer:
+    """
+        Synchronous data-parallel training. Every batch is split into n_workers shards. The calling process computes
+        the first shard, n_workers - 1 processes with a replica of the net the others. The gradients of the shards are
+        summed in shared memory, which gives exactly the gradient of the whole batch (the gradients of the modules are
+        sums over the batch). Then the optimizer takes one step on the net.
+        The parameters of the net and of the replicas are the same shared array, so every replica uses the updated
+        weights in the next step. The net is flattened (see ModuleI.flatten, by the first step if n_workers is None) and
+        can be used as before.
+        Any optimizer works, SGD and Adam use the flat parameter store.
+
+        with DataParallelTrainer(net, L2Loss(), Adam(net), n_workers=4) as trainer:
+            for x, y in batcher:
+                loss = trainer.step(x, y)
+
+        Use one BLAS thread per process (e.g. OMP_NUM_THREADS=1), otherwise the processes compete for the cores.
+    """
+    def __init__(self, net: ModuleI, loss: LossI, optimizer: OptimizerI, n_workers=None, workspace=True,
+                 min_shard=16):
+        """
+            :param net: the net that is trained
+            :param loss: loss function, computed by every process on its shard
+            :param optimizer: optimizer of net
+            :param n_workers: number of shards (processes including this one). If None, the number of cores, but at
+                              most one per min_shard samples of the first batch
+            :param workspace: the replicas reuse their buffers (see ModuleI.use_workspace)
+            :param min_shard: smallest shard for the default n_workers, below that the two barriers of every step
+                              cost more than the shard saves
+        """
+        assert optimizer.net is net
+        self.net = net
+        self.loss = loss
+        self.optimizer = optimizer
+        self.workspace = workspace
+        self.min_shard = min_shard
+        self.workers = []
+        # the shard buffers are created with the first batch
+        self.x_shared = None
+        self.y_shared = None
+        self.n_workers = None
+        if n_workers is not None:
+            self.setup(n_workers)
+
+    def setup(self, n_workers):
+        """
+            Move the parameters of the net into shared memory for n_workers processes.
+            Called by the first step if n_workers was not given.
+        """
+        assert n_workers >= 1
+        self.n_workers = n_workers
+        params = self.net.getParameters()
+        self.dtype = np.result_type(*params)
+        self.flat = SharedFlatParameters(sum(param.size for param in params), self.dtype, self.n_workers)
+        self.net.flatten(self.flat)
+        self.shard_sizes = RawArray('l', self.n_workers)
+        self.losses = RawArray('d', self.n_workers)
+        self.stop = RawValue('b', 0)
+        self.start_barrier = Barrier(self.n_workers)
+        self.done_barrier = Barrier(self.n_workers)
+
+    def start(self, x, y):
+        """
+            Start the processes. Called by the first step, the shard buffers have room for batches of this size.
+        """
+        assert len(self.workers) == 0
+        capacity = -(-x.shape[-1] // self.n_workers)
+        # one shard buffer per process
+        self.x_shared = _SharedArray((self.n_workers,) + x.shape[:-1] + (capacity,), self.dtype)
+        self.y_shared = _SharedArray((self.n_workers,) + np.shape(y)[:-1] + (capacity,), self.dtype)
+        self.stop.value = 0
+        net_string = self.net.toString()
+        for slot in range(1, self.n_workers):
+            worker = Process(target=_data_parallel_worker,
+                             args=(slot, net_string, self.flat, self.loss, self.x_shared, self.y_shared,
+                                   self.shard_sizes, self.losses, self.stop, self.start_barrier, self.done_barrier,
+                                   self.workspace),
+                             daemon=True)
+            worker.start()
+            self.workers.append(worker)
+        return self
+
+    def compute_gradients(self, x, y):
+        """
+            Forward and backward pass of the batch, the gradient of the whole batch is in the net afterwards.
+            :param x: batch (input size, N)
+            :param y: targets (target size, N) or (N,)
+            :return: sum of the losses of the batch
+        """
+        if self.n_workers is None:
+            self.setup(max(1, min(os.cpu_count(), x.shape[-1] // self.min_shard)))
+        if self.n_workers == 1:
+            loss, delta = self.loss(self.net(x), y)
+            self.net.backprop(delta)
+            return float(np.sum(loss))
+        if len(self.workers) == 0:
+            self.start(x, y)
+        n = x.shape[-1]
+        assert n <= self.n_workers * self.x_shared.shape[-1], "the batch is larger than the first one"
+        bounds = [n * i // self.n_workers for i in range(self.n_workers + 1)]
+        x_buffer = self.x_shared.array()
+        y_buffer = self.y_shared.array()
+        for slot in range(1, self.n_workers):
+            start, end = bounds[slot], bounds[slot + 1]
+            self.shard_sizes[slot] = end - start
+            x_buffer[slot][:, :end - start] = x[:, start:end]
+            y_buffer[slot][..., :end - start] = y[..., start:end]
+        # the other processes compute their shards meanwhile
+        self.start_barrier.wait()
+        try:
+            loss, delta = self.loss(self.net(x[:, :bounds[1]]), y[..., :bounds[1]])
+            self.net.backprop(delta)
+        except BaseException:
+            self.done_barrier.abort()
+            raise
+        self.done_barrier.wait()
+        for slot in range(1, self.n_workers):
+            self.flat.grads += self.flat.slot_grads(slot)
+        return float(np.sum(loss)) + sum(self.losses[1:])
+
+    def step(self, x, y):
+        """
+            compute_gradients and one step of the optimizer.
+            :return: mean loss of the batch
+        """
+        loss = self.compute_gradients(x, y)
+        self.optimizer.take_step()
+        return loss / x.shape[-1]
+
+    def close(self):
+        if len(self.workers) == 0:
+            return
+        self.stop.value = 1
+        try:
+            self.start_barrier.wait(timeout=5)
+        except BrokenBarrierError:
+            pass
+        for worker in self.workers:
+            worker.join(timeout=5)
+            if worker.is_alive():
+                worker.terminate()
+        self.workers = []
+        self.start_barrier.reset()
+        self.done_barrier.reset()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,59 @@
+"""
+    Floating point type used by network_backend. float32 by default, use float64 on request:
+
+        set_default_dtype(np.float64)           # globally
+        with default_dtype(np.float64): ...     # temporarily
+        LinearLayer(10, 5, dtype=np.float64)    # per module
+"""
+import numpy as np
+
+_default_dtype = np.dtype(np.float32)
+
+
+def set_default_dtype(dtype):
+    global _default_dtype
+    dtype = np.dtype(dtype)
+    assert dtype in [np.dtype(np.float32), np.dtype(np.float64)]
+    _default_dtype = dtype
+
+
+def get_default_dtype():
+    return _default_dtype
+
+
+def resolve_dtype(dtype=None):
+    """
+        :param dtype: requested dtype or None
+        :return: dtype, the default dtype if None was requested
+    """
+    if dtype is None:
+        return _default_dtype
+    return np.dtype(dtype)
+
+
+def as_float(array, dtype=None):
+    """
+        Convert floating point (and integer) arrays to the dtype (default dtype if None), without copying if possible.
+        Other arrays (e.g. object arrays) are returned unchanged.
+    """
+    array = np.asarray(array)
+    if array.dtype.kind not in "fiub":
+        return array
+    return array.astype(resolve_dtype(dtype), copy=False)
+
+
+class default_dtype:
+    """
+        Context manager that changes the default dtype temporarily.
+    """
+    def __init__(self, dtype):
+        self.dtype = dtype
+        self.previous = None
+
+    def __enter__(self):
+        self.previous = get_default_dtype()
+        set_default_dtype(self.dtype)
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        set_default_dtype(self.previous)
@@ -0,0 +1,59 @@
+import numpy as np
+from multiprocessing import RawArray, RawValue, Lock
+from network_backend.Modules import ModuleI
+
+
+class SharedParameters:
+    """
+        The parameters of a network in a shared memory buffer, so that other processes can read the current weights
+        without pickling the whole network.
+        The learner calls push after changing the weights, the workers call pull before using their copy of the net.
+        Create it before starting the processes and pass it to them.
+    """
+    def __init__(self, net: ModuleI):
+        self.shapes = [param.shape for param in net.getParameters()]
+        self.sizes = [int(np.prod(shape)) for shape in self.shapes]
+        self.dtype = np.result_type(*net.getParameters())
+        self.buffer = RawArray('f' if self.dtype == np.float32 else 'd', sum(self.sizes))
+        self.version = RawValue('l', 0)
+        self.lock = Lock()
+        self.push(net)
+
+    def _array(self):
+        return np.frombuffer(self.buffer, dtype=self.dtype)
+
+    def push(self, net: ModuleI):
+        """
+            Copy the parameters of net into the shared buffer.
+        """
+        params = net.getParameters()
+        assert [param.shape for param in params] == self.shapes
+        flat = getattr(net, "flat", None)
+        with self.lock:
+            if flat is not None:
+                self._array()[...] = flat.params
+            else:
+                np.concatenate([param.ravel() for param in params], out=self._array())
+            self.version.value += 1
+
+    def pull(self, net: ModuleI, version=-1):
+        """
+            Copy the shared parameters into net (in place) if they changed since version.
+            :param net: network with the same architecture as the one given to the constructor
+            :param version: version of the parameters net currently has
+            :return: version of the parameters net has now
+        """
+        if self.version.value == version:
+            return version
+        params = net.getParameters()
+        assert [param.shape for param in params] == self.shapes
+        with self.lock:
+            if getattr(net, "flat", None) is not None:
+                net.flat.params[...] = self._array()
+                return self.version.value
+            flat = self._array()
+            offset = 0
+            for param, size, shape in zip(params, self.sizes, self.shapes):
+                param[...] = flat[offset:offset + size].reshape(shape)
+                offset += size
+            return self.version.value
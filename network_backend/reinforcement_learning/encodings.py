@@ -1,4 +1,5 @@
 import numpy as np
+from network_backend.Precision import get_default_dtype
 
 
 class EncodingI:
@@ -9,103 +10,107 @@ class EncodingI:
             :param board: board state
             :param phase: phase
             :param playerID: current player ID
-            :return: encoding of the parameters into a vector
+            :return: encoding of the parameters into a vector, a new array on every call (callers like
+                     QGoal.call_batch and the replay memories keep it)
         """
         raise NotImplementedError()
 
     def __call__(self, move, board, phase, playerID):
         return self.call(move, board, phase, playerID)
 
+    @classmethod
+    def encode_batch(cls, moves, board, phase, playerID):
+        """
+            Encodes several moves in the same position at once.
+            :param moves: list of actions
+            :return: matrix with the encoding of moves[i] as column i, a new array on every call
+        """
+        return np.stack([cls.call(move, board, phase, playerID) for move in moves], axis=1)
+
+
+# index of the point (r, x, y) in the board part of the encodings (see QNetPlayer), computed once
+POINT2IDX = {(r, x, y): i for i, (x, y, r) in
+             enumerate((x, y, r) for x in range(3) for y in range(3) if x != 1 or y != 1 for r in range(3))}
+PHASE2IDX = {"set": 0, "move": 1, "jump": 2, "take": 3}
+MOVE_TYPE2IDX = {"set": 0, "move": 1, "take": 2}
+_SHIFTS = np.arange(24)
+
+# offsets of the parts of the encodings
+_MY_POS = 4
+_ENEMY_POS = _MY_POS + 24
+_MOVE_TYPE = _ENEMY_POS + 24
+_MOVE_START = _MOVE_TYPE + 3
+_MOVE_END = _MOVE_START + 24
+Q_ENC_SIZE = _MOVE_END + 24
+V_ENC_SIZE = _MOVE_TYPE
+
+
+def _point_mask(board, playerID):
+    # bitmask over the 24 points (same order as the encoding) with the points of player_map[playerID]
+    if hasattr(board, "get_mask"):
+        return board.get_mask(playerID)
+    mask = 0
+    for point, i in POINT2IDX.items():
+        if board[point] == board.player_map[playerID]:
+            mask |= 1 << i
+    return mask
+
+
+def _encode_state(enc, board, phase, playerID):
+    """
+        Writes phase, my positions and enemy positions into enc (vector or matrix with the encodings as columns).
+    """
+    enc[PHASE2IDX[phase]] = 1.0
+    enc[_MY_POS:_ENEMY_POS] = (_point_mask(board, playerID) >> _SHIFTS & 1).reshape(
+        (24,) + (1,) * (enc.ndim - 1))
+    enc[_ENEMY_POS:_MOVE_TYPE] = (_point_mask(board, 1 - playerID) >> _SHIFTS & 1).reshape(
+        (24,) + (1,) * (enc.ndim - 1))
+
 
 class QEncoding(EncodingI):
     @classmethod
     def call(cls, move, board, phase, playerID):
-        assert phase in ["set", "move", "jump", "take"]
-        phase2idx = {"set": 0, "move": 1, "jump": 2, "take": 3}
-        moveType2idx = {"set": 0, "move": 1, "take": 2}
-        phase_enc = [0.0, 0.0, 0.0, 0.0]
-        phase_enc[phase2idx[phase]] = 1.0
-        my_pos = []
-        for x in range(3):
-            for y in range(3):
-                if x == 1 and y == 1:
-                    continue
-                for r in range(3):
-                    if board[r, x, y] == board.player_map[playerID]:
-                        my_pos.append(1.0)
-                    else:
-                        my_pos.append(0.0)
-        enemy_pos = []
-        for x in range(3):
-            for y in range(3):
-                if x == 1 and y == 1:
-                    continue
-                for r in range(3):
-                    if board[r, x, y] == board.player_map[1 - playerID]:
-                        enemy_pos.append(1.0)
-                    else:
-                        enemy_pos.append(0.0)
-        move_type_enc = [0.0, 0.0, 0.0]
-        move_type_enc[moveType2idx[move.type]] = 1.0
-        move_start = []
-        for x in range(3):
-            for y in range(3):
-                if x == 1 and y == 1:
-                    continue
-                for r in range(3):
-                    if (r, x, y) == move.start:
-                        move_start.append(1.0)
-                    else:
-                        move_start.append(0.0)
-        move_end = []
-        for x in range(3):
-            for y in range(3):
-                if x == 1 and y == 1:
-                    continue
-                for r in range(3):
-                    if (r, x, y) == move.end:
-                        move_end.append(1.0)
-                    else:
-                        move_end.append(0.0)
-        assert len(phase_enc) == 4
-        assert len(my_pos) == 24
-        assert len(enemy_pos) == 24
-        assert len(move_type_enc) == 3
-        assert len(move_start) == 24
-        assert len(move_end) == 24
-        enc = phase_enc + my_pos + enemy_pos + move_type_enc + move_start + move_end
-        return np.array(enc)
+        assert phase in PHASE2IDX
+        enc = np.zeros(Q_ENC_SIZE, dtype=get_default_dtype())
+        _encode_state(enc, board, phase, playerID)
+        enc[_MOVE_TYPE + MOVE_TYPE2IDX[move.type]] = 1.0
+        if move.start in POINT2IDX:
+            enc[_MOVE_START + POINT2IDX[move.start]] = 1.0
+        if move.end in POINT2IDX:
+            enc[_MOVE_END + POINT2IDX[move.end]] = 1.0
+        return enc
+
+    @classmethod
+    def encode_batch(cls, moves, board, phase, playerID):
+        assert phase in PHASE2IDX
+        enc = np.zeros((Q_ENC_SIZE, len(moves)), dtype=get_default_dtype())
+        _encode_state(enc, board, phase, playerID)
+        cols = np.arange(len(moves))
+        enc[[_MOVE_TYPE + MOVE_TYPE2IDX[move.type] for move in moves], cols] = 1.0
+        starts = [(_MOVE_START + POINT2IDX[move.start], c) for c, move in enumerate(moves) if move.start in POINT2IDX]
+        ends = [(_MOVE_END + POINT2IDX[move.end], c) for c, move in enumerate(moves) if move.end in POINT2IDX]
+        for idx in (starts, ends):
+            if idx:
+                rows, idx_cols = zip(*idx)
+                enc[list(rows), list(idx_cols)] = 1.0
+        return enc
 
 
 class VEncoding(EncodingI):
     @classmethod
     def call(cls, move, board, phase, playerID):
-        assert phase in ["set", "move", "jump", "take"]
-        phase2idx = {"set": 0, "move": 1, "jump": 2, "take": 3}
-        phase_enc = [0.0, 0.0, 0.0, 0.0]
-        phase_enc[phase2idx[phase]] = 1.0
-        my_pos = []
-        for x in range(3):
-            for y in range(3):
-                if x == 1 and y == 1:
-                    continue
-                for r in range(3):
-                    if board[r, x, y] == board.player_map[playerID]:
-                        my_pos.append(1.0)
-                    else:
-                        my_pos.append(0.0)
-        enemy_pos = []
-        for x in range(3):
-            for y in range(3):
-                if x == 1 and y == 1:
-                    continue
-                for r in range(3):
-                    if board[r, x, y] == board.player_map[1 - playerID]:
-                        enemy_pos.append(1.0)
-                    else:
-                        enemy_pos.append(0.0)
-        enc = phase_enc + my_pos + enemy_pos
-        return np.array(enc)
+        assert phase in PHASE2IDX
+        enc = np.zeros(V_ENC_SIZE, dtype=get_default_dtype())
+        _encode_state(enc, board, phase, playerID)
+        return enc
+
+    @classmethod
+    def encode_batch(cls, moves, board, phase, playerID):
+        # the move is not part of the encoding, so all columns are the same
+        assert phase in PHASE2IDX
+        enc = np.zeros((V_ENC_SIZE, len(moves)), dtype=get_default_dtype())
+        _encode_state(enc, board, phase, playerID)
+        return enc
 
 
 class TTTQEncoding(EncodingI):
@@ -120,7 +125,7 @@ class TTTQEncoding(EncodingI):
         move_pos = [0.0 for _ in range(9)]
         move_pos[move] = 1.0
         encoding = my_pos + enemy_pos + move_pos
-        return np.array(encoding)
+        return np.array(encoding, dtype=get_default_dtype())
 
 
 class TTTVEncoding(EncodingI):
@@ -133,4 +138,4 @@ class TTTVEncoding(EncodingI):
         for pos in board.get_player_pos(1 - playerID):
             enemy_pos[pos] = 1.0
         encoding = my_pos + enemy_pos
-        return np.array(encoding)
+        return np.array(encoding, dtype=get_default_dtype())
@@ -1,5 +1,8 @@
 from copy import deepcopy
 
+import numpy as np
+
+from network_backend.Modules import no_grad
 from network_backend.reinforcement_learning.encodings import EncodingI
 from NineMenMorris.moves import Move
 
@@ -24,6 +27,42 @@ class GoalFunctionI:
     def __call__(self, net, encoding: EncodingI, gamma, prev, phase_prev, a: Move, r, post, phase_post, turn_player):
         return self.call(net, encoding, gamma, prev, phase_prev, a, r, post, phase_post, turn_player)
 
+    def call_batch(self, net, encoding: EncodingI, gamma, actions, rewards, posts, phases_post, turn_players):
+        """
+            Goal values of many transitions at once. The previous states are not needed by the goal functions.
+            :return: numpy array with the goal value of transition i at position i
+        """
+        return np.array([self.call(net, encoding, gamma, None, None, a, r, post, phase_post, turn_player)
+                         for a, r, post, phase_post, turn_player in
+                         zip(actions, rewards, posts, phases_post, turn_players)], dtype=np.float64)
+
+
+def segmented_max_targets(net, blocks, segments, rewards, gamma, max_batch=4096):
+    """
+        Evaluate all candidate encodings with a few large forward passes and reduce them per transition.
+        :param net: net for the values of the candidates
+        :param blocks: list of matrices with encoded candidates as columns, the candidates of one transition are
+            consecutive
+        :param segments: for every transition the number of candidates, 0 means the goal is just the reward
+        :param rewards: rewards of the transitions
+        :param gamma: exponential discount
+        :param max_batch: maximal number of columns per forward pass
+        :return: r + gamma * max over the candidates (r if there is no candidate)
+    """
+    targets = np.array(rewards, dtype=np.float64)
+    if len(blocks) == 0:
+        return targets
+    encoded = np.concatenate(blocks, axis=1)
+    values = np.empty(encoded.shape[1])
+    with no_grad(net):
+        for i in range(0, encoded.shape[1], max_batch):
+            values[i:i + max_batch] = net(encoded[:, i:i + max_batch])[0]
+    segments = np.asarray(segments)
+    has_candidates = segments > 0
+    starts = np.cumsum(segments)[has_candidates] - segments[has_candidates]
+    targets[has_candidates] += gamma * np.maximum.reduceat(values, starts)
+    return targets
+
 
 class QGoal(GoalFunctionI):
     def call(self, net, encoding: EncodingI, gamma, prev, phase_prev, a, r, post, phase_post, turn_player):
@@ -39,6 +78,19 @@ class QGoal(GoalFunctionI):
                 max_Q = q_val
         return r + gamma * max_Q
 
+    def call_batch(self, net, encoding: EncodingI, gamma, actions, rewards, posts, phases_post, turn_players):
+        blocks = []
+        segments = []
+        for post, phase_post, turn_player in zip(posts, phases_post, turn_players):
+            if post.is_terminal(phase=phase_post, player=turn_player):
+                segments.append(0)
+                continue
+            legal = post.legal_moves(phase_post, turn_player)
+            if len(legal) > 0:
+                blocks.append(encoding.encode_batch(legal, post, phase_post, turn_player))
+            segments.append(len(legal))
+        return segmented_max_targets(net, blocks, segments, rewards, gamma)
+
 
 class VGoal(GoalFunctionI):
     def call(self, net, encoding: EncodingI, gamma, prev, phase_prev, a: Move, r, post, phase_post, turn_player):
@@ -57,3 +109,27 @@ class VGoal(GoalFunctionI):
         return r + gamma * max_v
         # assumption: the action a is the best possible, given the current state of the net (/the state value function)
         return r + gamma * -net(encoding(None, post, phase_post, 1-turn_player))[0][0]
+
+    def call_batch(self, net, encoding: EncodingI, gamma, actions, rewards, posts, phases_post, turn_players):
+        blocks = []
+        segments = []
+        for post, phase_post, turn_player in zip(posts, phases_post, turn_players):
+            if post.is_terminal(phase=phase_post, player=turn_player):
+                segments.append(0)
+                continue
+            legal = post.legal_moves(phase_post, turn_player)
+            columns = []
+            can_undo = hasattr(post, "undo")
+            for move in legal:
+                if can_undo:
+                    token = post.do(move, turn_player)
+                    columns.append(encoding(move, post, None, turn_player))
+                    post.undo(token)
+                else:
+                    after = deepcopy(post)
+                    after.do(move, turn_player)
+                    columns.append(encoding(move, after, None, turn_player))
+            if len(columns) > 0:
+                blocks.append(np.stack(columns, axis=1))
+            segments.append(len(legal))
+        return segmented_max_targets(net, blocks, segments, rewards, gamma)
@@ -0,0 +1,86 @@
+import numpy as np
+
+
+class MoveTelemetry:
+    """
+        Latency and search counters of the moves of a player (see PlayerI.timed_move in both games).
+        Every move records its latency in seconds and counters like the number of searched nodes, simulations,
+        evaluated positions of a net and cache lookups / hits. Counters a player does not report are 0.
+    """
+    COUNTERS = ["nodes", "simulations", "nn_evals", "cache_hits", "cache_lookups"]
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.latencies = []
+        self.counters = {name: [] for name in self.COUNTERS}
+
+    def record(self, latency, **counters):
+        """
+            :param latency: time of the move in seconds
+            :param counters: counters of the move (nodes, simulations, nn_evals, cache_hits, cache_lookups, ...)
+        """
+        for name in counters:
+            if name not in self.counters:
+                # counters that show up later were 0 for the moves before
+                self.counters[name] = [0] * len(self.latencies)
+        self.latencies.append(latency)
+        for name, values in self.counters.items():
+            values.append(counters.get(name, 0))
+
+    def n_moves(self):
+        return len(self.latencies)
+
+    def avrg_move_time(self):
+        if len(self.latencies) == 0:
+            return 0.0
+        return sum(self.latencies) / len(self.latencies)
+
+    def latency(self):
+        """
+            :return: p50, p95, max and mean of the latencies in seconds
+        """
+        if len(self.latencies) == 0:
+            return {"p50": 0.0, "p95": 0.0, "max": 0.0, "mean": 0.0}
+        p50, p95 = np.percentile(self.latencies, [50, 95])
+        return {"p50": float(p50), "p95": float(p95), "max": max(self.latencies), "mean": self.avrg_move_time()}
+
+    def histogram(self, bins=10):
+        """
+            :return: counts and bin edges of the latencies (see np.histogram)
+        """
+        return np.histogram(self.latencies, bins=bins)
+
+    def moves_over(self, budget):
+        """
+            :param budget: time per move in seconds
+            :return: number of moves that took longer
+        """
+        return sum(1 for latency in self.latencies if latency > budget)
+
+    def per_move(self, name):
+        """
+            :return: mean, max and total of a counter over the moves
+        """
+        values = self.counters[name]
+        if len(values) == 0:
+            return {"mean": 0.0, "max": 0, "total": 0}
+        return {"mean": sum(values) / len(values), "max": max(values), "total": sum(values)}
+
+    def cache_hit_rate(self):
+        """
+            :return: hits / lookups over all moves, None if nothing was looked up
+        """
+        lookups = sum(self.counters["cache_lookups"])
+        if lookups == 0:
+            return None
+        return sum(self.counters["cache_hits"]) / lookups
+
+    def summary(self):
+        return {
+            "moves": self.n_moves(),
+            "latency": self.latency(),
+            "counters": {name: self.per_move(name) for name in self.counters},
+            "cache_hit_rate": self.cache_hit_rate(),
+        }
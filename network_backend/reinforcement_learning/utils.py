@@ -1,38 +1,80 @@
 from copy import deepcopy
+import numpy as np
 from network_backend.reinforcement_learning.encodings import EncodingI
 from network_backend.reinforcement_learning.goalFunctions import GoalFunctionI
 
 
+class TargetNetwork:
+    """
+        Frozen copy of a net for the goal values. The copy is synced with the net every update_every calls of get.
+        With update_every=None the net itself is used.
+    """
+    def __init__(self, net, update_every=None):
+        self.net = net
+        self.update_every = update_every
+        self.frozen = None
+        self.calls = 0
+
+    def sync(self):
+        self.frozen = deepcopy(self.net)
+        # the frozen copy is never trained
+        self.frozen.set_mode("eval")
+
+    def get(self):
+        if self.update_every is None:
+            return self.net
+        if self.frozen is None or self.calls % self.update_every == 0:
+            self.sync()
+        self.calls += 1
+        return self.frozen
+
+
 class ReplayMem:
-    def __init__(self, capacity, batch_size, Q_fctn, gamma, encode: EncodingI, goal_value_function: GoalFunctionI):
+    def __init__(self, capacity, batch_size, Q_fctn, gamma, encode: EncodingI, goal_value_function: GoalFunctionI,
+                 target_update=None):
+        """
+            :param target_update: compute the goal values with a frozen copy of Q_fctn that is synced every
+                target_update calls of get_data / get_v_data (None: always use Q_fctn)
+        """
         self.N = capacity
         self.Q_fctn = Q_fctn
+        self.target = TargetNetwork(Q_fctn, target_update)
         self.gamma = gamma
         self.encode = encode
         self.goal = goal_value_function
         self.mem = []
+        # position of the oldest transition once the memory is full
+        self.pos = 0
 
     def add(self, state_prev, phase_prev, action, reward, state_post, phase_post, turn_player=0):
-        if len(self.mem) >= self.N:
-            self.mem = self.mem[1:]
         prev = deepcopy(state_prev)
         a = action
         r = reward
         post = deepcopy(state_post)
-        self.mem.append([prev, phase_prev, a, r, post, phase_post, turn_player])
+        if len(self.mem) < self.N:
+            self.mem.append([prev, phase_prev, a, r, post, phase_post, turn_player])
+        else:
+            # overwrite the oldest transition
+            self.mem[self.pos % len(self.mem)] = [prev, phase_prev, a, r, post, phase_post, turn_player]
+            self.pos = (self.pos + 1) % len(self.mem)
+
+    def goal_values(self):
+        return self.goal.call_batch(self.target.get(), self.encode, self.gamma, [p[2] for p in self.mem],
+                                    [p[3] for p in self.mem], [p[4] for p in self.mem], [p[5] for p in self.mem],
+                                    [p[6] for p in self.mem])
 
     def get_data(self):
-        return [
-            (self.encode(p[2], p[0], p[1], p[6]), self.goal(self.Q_fctn, self.encode, self.gamma, p[0], p[1], p[2],
-                                                            p[3], p[4], p[5], p[6])) for p in self.mem]
+        goals = self.goal_values()
+        return [(self.encode(p[2], p[0], p[1], p[6]), goal) for p, goal in zip(self.mem, goals)]
 
     def get_v_data(self):
         data_list = []
+        goals = self.goal_values()
         # simulate outcome:
-        for prev, phase_p, a, r, post, phase_p, playerID in self.mem:
+        for (prev, phase_p, a, r, post, phase_post, playerID), goal in zip(self.mem, goals):
             intermed = deepcopy(prev)
             intermed.do(move=a, player=playerID)
-            data_list.append((self.encode(a, intermed, None, playerID), self.goal(self.Q_fctn, self.encode, self.gamma, prev, phase_p, a, r, post, phase_p, playerID)))
+            data_list.append((self.encode(a, intermed, None, playerID), goal))
         return data_list
 
 
@@ -53,6 +95,200 @@ class ReplayMem:
         return self.mem
 
 
+class ArrayReplayMem:
+    """
+        Replay memory as a ring buffer of preallocated numpy arrays.
+        The input of the net is encoded once when the transition is added, rewards, phases and players are stored in
+        arrays. Only the following states are kept as objects, they are needed for the goal values.
+        Insert and eviction are O(1), sample gathers a random minibatch directly into training arrays.
+    """
+    def __init__(self, capacity, batch_size, Q_fctn, gamma, encode: EncodingI, goal_value_function: GoalFunctionI,
+                 v_data=False, phases=(None, "set", "move", "jump", "take"), target_update=None):
+        """
+            :param v_data: encode the state after the action instead of the state and the action (see get_v_data)
+            :param phases: all possible phases, they are stored as their index in this list
+            :param target_update: compute the goal values with a frozen copy of Q_fctn that is synced every
+                target_update calls of sample / get_data (None: always use Q_fctn)
+        """
+        self.N = capacity
+        self.batch_size = batch_size
+        self.Q_fctn = Q_fctn
+        self.target = TargetNetwork(Q_fctn, target_update)
+        self.gamma = gamma
+        self.encode = encode
+        self.goal = goal_value_function
+        self.v_data = v_data
+        self.phases = list(phases)
+        self.x = None
+        self.rewards = np.zeros(capacity)
+        self.phase_post = np.zeros(capacity, dtype=np.int8)
+        self.players = np.zeros(capacity, dtype=np.int8)
+        self.actions = np.empty(capacity, dtype=object)
+        self.post = np.empty(capacity, dtype=object)
+        self.size = 0
+        self.pos = 0
+
+    def add(self, state_prev, phase_prev, action, reward, state_post, phase_post, turn_player=0):
+        if self.v_data:
+            intermed = deepcopy(state_prev)
+            intermed.do(move=action, player=turn_player)
+            x = self.encode(action, intermed, None, turn_player)
+        else:
+            x = self.encode(action, state_prev, phase_prev, turn_player)
+        if self.x is None:
+            self.x = np.zeros((self.N, x.shape[0]), dtype=x.dtype)
+        i = self.pos
+        self.x[i] = x
+        self.rewards[i] = reward
+        self.phase_post[i] = self.phases.index(phase_post)
+        self.players[i] = turn_player
+        self.actions[i] = action
+        self.post[i] = deepcopy(state_post)
+        self.pos = (self.pos + 1) % self.N
+        self.size = min(self.size + 1, self.N)
+
+    def __len__(self):
+        return self.size
+
+    def targets(self, idx):
+        """
+            :param idx: indices of transitions
+            :return: goal values of the transitions given the current net, shape = (len(idx),)
+        """
+        idx = np.asarray(idx, dtype=np.int64)
+        return self.goal.call_batch(self.target.get(), self.encode, self.gamma, self.actions[idx],
+                                    self.rewards[idx], self.post[idx], [self.phases[p] for p in self.phase_post[idx]],
+                                    [int(player) for player in self.players[idx]])
+
+    def sample(self, batch_size=None, out=None):
+        """
+            Uniform random minibatch.
+            :param out: optional array of shape (input size, batch size) the inputs are gathered into
+            :return: inputs: shape = (input size, batch size), goal values: shape = (1, batch size), indices
+        """
+        assert self.size > 0
+        if batch_size is None:
+            batch_size = self.batch_size
+        idx = np.random.randint(0, self.size, size=batch_size)
+        if out is None:
+            out = np.empty((self.x.shape[1], batch_size), dtype=self.x.dtype)
+        np.take(self.x, idx, axis=0, out=out.T)
+        return out, self.targets(idx)[np.newaxis, :], idx
+
+    def get_data(self):
+        targets = self.targets(np.arange(self.size))
+        return [(self.x[i], targets[i]) for i in range(self.size)]
+
+
+class SumTree:
+    """
+        Binary tree in an array where every node is the sum of its two children.
+        The leaves are the priorities, the root (index 1) is the total. Leaf i is at index size + i.
+        Updates and proportional sampling take O(log N) and are vectorized over batches.
+    """
+    def __init__(self, capacity):
+        self.size = 1
+        while self.size < capacity:
+            self.size *= 2
+        self.tree = np.zeros(2 * self.size)
+
+    def total(self):
+        return self.tree[1]
+
+    def __getitem__(self, idx):
+        return self.tree[self.size + np.asarray(idx)]
+
+    def update(self, idx, priorities):
+        """
+            Set the priorities of the leaves idx and update the sums above them.
+        """
+        nodes = self.size + np.asarray(idx, dtype=np.int64)
+        self.tree[nodes] = priorities
+        nodes = np.unique(nodes // 2)
+        while nodes[0] >= 1:
+            self.tree[nodes] = self.tree[2 * nodes] + self.tree[2 * nodes + 1]
+            if nodes[0] == 1:
+                break
+            nodes = np.unique(nodes // 2)
+
+    def find(self, values):
+        """
+            :param values: numbers in [0, total)
+            :return: for every value the leaf i with sum(leaves before i) <= value < sum(leaves up to i)
+        """
+        values = np.array(values, dtype=np.float64)
+        nodes = np.ones(len(values), dtype=np.int64)
+        while nodes[0] < self.size:
+            left = self.tree[2 * nodes]
+            go_right = values >= left
+            values -= left * go_right
+            nodes = 2 * nodes + go_right
+        return nodes - self.size
+
+
+class PrioritizedReplayMem(ArrayReplayMem):
+    """
+        Prioritized experience replay (https://arxiv.org/pdf/1511.05952.pdf).
+        Transitions are sampled proportional to priority^alpha, new transitions get the maximal priority so far.
+        The priorities are the absolute TD errors, i.e. the delta returned by L2Loss:
+
+            x, y, idx, weights = memory.sample()
+            loss, delta = L2Loss()(net(x), y)
+            memory.update_priorities(idx, delta[0])
+            net.backprop(delta * weights)
+    """
+    def __init__(self, capacity, batch_size, Q_fctn, gamma, encode: EncodingI, goal_value_function: GoalFunctionI,
+                 alpha=0.6, beta=0.4, eps=1e-6, **kwargs):
+        """
+            :param alpha: how much the priorities count (0: uniform sampling)
+            :param beta: exponent of the importance sampling weights (1: full correction)
+            :param eps: added to the TD errors, so that every transition can be sampled
+        """
+        super(PrioritizedReplayMem, self).__init__(capacity, batch_size, Q_fctn, gamma, encode, goal_value_function,
+                                                   **kwargs)
+        self.alpha = alpha
+        self.beta = beta
+        self.eps = eps
+        self.tree = SumTree(capacity)
+        self.max_priority = 1.0
+
+    def add(self, state_prev, phase_prev, action, reward, state_post, phase_post, turn_player=0):
+        i = self.pos
+        super(PrioritizedReplayMem, self).add(state_prev, phase_prev, action, reward, state_post, phase_post,
+                                              turn_player)
+        self.tree.update([i], self.max_priority ** self.alpha)
+
+    def sample(self, batch_size=None, out=None):
+        """
+            Minibatch sampled proportional to the priorities (stratified over batch_size equal segments).
+            :return: inputs: shape = (input size, batch size), goal values: shape = (1, batch size), indices,
+                importance sampling weights: shape = (1, batch size)
+        """
+        assert self.size > 0
+        if batch_size is None:
+            batch_size = self.batch_size
+        total = self.tree.total()
+        segment = total / batch_size
+        values = (np.arange(batch_size) + np.random.random(batch_size)) * segment
+        idx = np.minimum(self.tree.find(np.minimum(values, np.nextafter(total, 0))), self.size - 1)
+        if out is None:
+            out = np.empty((self.x.shape[1], batch_size), dtype=self.x.dtype)
+        np.take(self.x, idx, axis=0, out=out.T)
+        probs = self.tree[idx] / total
+        weights = (self.size * probs) ** -self.beta
+        weights /= weights.max()
+        return out, self.targets(idx)[np.newaxis, :], idx, weights[np.newaxis, :]
+
+    def update_priorities(self, idx, td_errors):
+        """
+            :param idx: indices returned by sample
+            :param td_errors: differences between output and goal values of the sampled transitions
+        """
+        priorities = np.abs(np.ravel(td_errors)) + self.eps
+        self.max_priority = max(self.max_priority, priorities.max())
+        self.tree.update(idx, priorities ** self.alpha)
+
+
 class DataMemory:
     def __init__(self, num_games):
         self.num_games = num_games
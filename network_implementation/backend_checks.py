@@ -0,0 +1,47 @@
+import pathlib, sys
+from copy import deepcopy
+
+path = pathlib.Path().absolute()
+sys.path.insert(1, str(path))
+
+from network_backend.Modules import FullyConnectedNet, SequentialNetwork, LinearLayer
+from network_backend.Loss import L2Loss
+from network_backend.Optimizers import Adam
+from network_backend.NonLinear import fctn_dict, Sigmoid
+from network_backend.Parallel import DataParallelTrainer
+import numpy as np
+
+# Quick checks of the network backend, every check raises an AssertionError if it fails.
+
+
+def check_deepcopy_parallel():
+    # a net bound to a DataParallelTrainer uses shared memory, a copy gets private parameters
+    net = SequentialNetwork([FullyConnectedNet([10, 8], nonLin=Sigmoid()), LinearLayer(8, 1)])
+    with DataParallelTrainer(net, L2Loss(), Adam(net), n_workers=2) as trainer:
+        x = np.random.rand(10, 8)
+        y = np.random.rand(1, 8)
+        trainer.step(x, y)
+        cpy = deepcopy(net)
+        assert np.allclose(cpy(x), net(x))
+        trainer.step(x, y)
+        assert not np.allclose(cpy(x), net(x))
+        assert not np.shares_memory(cpy.flat.params, net.flat.params)
+
+
+def check_activations_in_place():
+    # out may be the input itself (see ActivationI)
+    x = np.random.rand(5, 7).astype(np.float32) * 4 - 2
+    for name, cls in fctn_dict.items():
+        activation = cls()
+        y = activation(x.copy())
+        inplace = x.copy()
+        assert np.allclose(activation(inplace, out=inplace), y), name
+        d = activation.d(y.copy())
+        inplace = y.copy()
+        assert np.allclose(activation.d(inplace, out=inplace), d), name
+
+
+if __name__ == "__main__":
+    for check in [check_deepcopy_parallel, check_activations_in_place]:
+        check()
+        print("{}: ok".format(check.__name__))
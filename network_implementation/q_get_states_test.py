@@ -19,6 +19,8 @@ from network_backend.Modules import FullyConnectedNet, ModuleI, SequentialNetwor
 from network_backend.reinforcement_learning.rewardFunctions import SimpleReward
 from network_backend.reinforcement_learning.goalFunctions import QGoal
 from network_backend.Batching import SimpleBatcher
+from network_backend.Parallel import DataParallelTrainer
+from NineMenMorris.selfplay import SelfPlayPool
 
 net = SequentialNetwork([FullyConnectedNet([103, 100, 100, 50, 50, 10], nonLin=Sigmoid()),
                          LinearLayer(10, 1)])
@@ -38,6 +40,14 @@ game = Game(run=False, p0=player0, p1=player1, mem=memory, reward=reward)
 
 opt = Adam(net, alpha=0.001, beta_1=0.9, beta_2=0.999, eps=10e-8)
 criterion = L2Loss()
+# processes for the training steps, if None one per core but at most one per 16 samples of a batch
+workers = None
+trainer = DataParallelTrainer(net, criterion, opt, n_workers=workers)
+# processes that play the self-play games, 0: the games are played in this process
+self_play_workers = max(1, os.cpu_count() // 2)
+games_per_epoch = 1
+if self_play_workers > 0:
+    pool = SelfPlayPool(net, reward, n_workers=self_play_workers, eps=0.05, max_steps=500).start()
 
 
 batch_size = 30
@@ -71,8 +81,12 @@ for epoch in range(epochs):
         with open(folder + "morris_ep_{}.net".format(epoch), "w+") as f:
             net.toFile(f)
     print("Epoch {}".format(epoch))
-    n = game.learn(0.05, max_steps=500)
-    print("\tPlayed for {} steps".format(n))
+    if self_play_workers > 0:
+        games, n = pool.collect(memory, games=games_per_epoch)
+        print("\tCollected {} games with {} steps".format(games, n))
+    else:
+        n = game.learn(0.05, max_steps=500)
+        print("\tPlayed for {} steps".format(n))
     batcher = SimpleBatcher(batch_size, memory.get_data())
     test_batcher = batcher.subset_percent(0.1)
 
@@ -82,10 +96,7 @@ for epoch in range(epochs):
     last_loss = float("inf")
     while learning:
         for x, y in batcher:
-            out = net(x)
-            loss, delta = criterion(out, y)
-            net.backprop(delta)
-            opt.take_step()
+            trainer.step(x, y)
 
         test_loss = 0
         for x, y in test_batcher:
@@ -97,6 +108,9 @@ for epoch in range(epochs):
         last_loss = test_loss
         i += 1
     print("\tLearned for {} epochs".format(i))
+    if self_play_workers > 0:
+        # the next games are played with the new weights
+        pool.update_weights()
     print("\tFinal test loss = {}".format(test_loss))
 
     # Evaluation and plotting:
@@ -138,6 +152,9 @@ for epoch in range(epochs):
         ax[1].set_title("Avrg Q on fixed states")
         plt.pause(0.001)
         plt.draw()
+trainer.close()
+if self_play_workers > 0:
+    pool.close()
 end = time.time()
 time_diff = end-start
 print("Trained for \n\t {} s \n \t {} epochs\n \t {} s/epoch".format(time_diff, epoch+1, time_diff/(epoch+1)))
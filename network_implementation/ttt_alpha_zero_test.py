@@ -19,7 +19,7 @@ from TicTacToe.players import QNetPlayer, RandomPlayer, VNetPlayer, AlphaZeroPla
 from network_backend.reinforcement_learning.utils import ReplayMem, DataMemory
 from network_backend.reinforcement_learning.encodings import QEncoding, TTTQEncoding, TTTVEncoding
 from TicTacToe.gamestate import Game
-from network_backend.Modules import FullyConnectedNet, ModuleI, SequentialNetwork, LinearLayer
+from network_backend.Modules import FullyConnectedNet, ModuleI, SequentialNetwork, LinearLayer, MultiHeadNetwork
 from network_backend.reinforcement_learning.rewardFunctions import SimpleReward, OnlyWinReward
 from network_backend.reinforcement_learning.goalFunctions import QGoal, VGoal
 from network_backend.Batching import SimpleBatcher, TwoGoalBatcher
@@ -28,38 +28,45 @@ folder = "networks/ttt_mcts_learning_enemy_gets_neg_val/"
 load_saved_version = True
 offset = 1400
 
-net_pre = FullyConnectedNet([18, 20, 50])
-net_val = FullyConnectedNet([50, 1], nonLin=LeakyReLU())
-net_distr = SequentialNetwork([FullyConnectedNet([50, 50], nonLin=LeakyReLU()), FullyConnectedNet([50, 9], nonLin=Softmax())])
+# trunk with the heads (value, distribution)
+net = MultiHeadNetwork(FullyConnectedNet([18, 20, 50]),
+                       [FullyConnectedNet([50, 1], nonLin=LeakyReLU()),
+                        SequentialNetwork([FullyConnectedNet([50, 50], nonLin=LeakyReLU()), FullyConnectedNet([50, 9], nonLin=Softmax())])])
 
 if load_saved_version:
     assert offset != 0
-    list_of_files = glob.glob(folder+"*.pre.net")
-    latest_file = max(list_of_files, key=os.path.getctime)
-    print("used " + latest_file)
-    net_pre = ModuleI.fromFile(latest_file)
-    list_of_files = glob.glob(folder + "*.dist.net")
-    latest_file = max(list_of_files, key=os.path.getctime)
-    print("used " + latest_file)
-    net_distr = ModuleI.fromFile(latest_file)
-    list_of_files = glob.glob(folder + "*.val.net")
-    latest_file = max(list_of_files, key=os.path.getctime)
-    net_val = ModuleI.fromFile(latest_file)
-    print("used "+latest_file)
+    list_of_files = glob.glob(folder + "*.heads.net")
+    if len(list_of_files) > 0:
+        latest_file = max(list_of_files, key=os.path.getctime)
+        net = ModuleI.fromFile(latest_file)
+        print("used " + latest_file)
+    else:
+        # older versions saved the three nets separately
+        list_of_files = glob.glob(folder+"*.pre.net")
+        latest_file = max(list_of_files, key=os.path.getctime)
+        print("used " + latest_file)
+        net_pre = ModuleI.fromFile(latest_file)
+        list_of_files = glob.glob(folder + "*.dist.net")
+        latest_file = max(list_of_files, key=os.path.getctime)
+        print("used " + latest_file)
+        net_distr = ModuleI.fromFile(latest_file)
+        list_of_files = glob.glob(folder + "*.val.net")
+        latest_file = max(list_of_files, key=os.path.getctime)
+        net_val = ModuleI.fromFile(latest_file)
+        print("used "+latest_file)
+        net = MultiHeadNetwork(net_pre, [net_val, net_distr])
 else:
     offset = 0
 
-player0 = AlphaZeroPlayer(net_pre, net_val, net_distr, 0)
-player1 = AlphaZeroPlayer(net_pre, net_val, net_distr, 1)
+player0 = AlphaZeroPlayer(net, playerID=0)
+player1 = AlphaZeroPlayer(net, playerID=1)
 game = Game(run=False, p1=player0, p0=player1)
 
 crit_d = CrossEntropyLoss()
 crit_v = L2Loss()
 memory = DataMemory(1000)
 
-opt_pre = Adam(net_pre)
-opt_val = Adam(net_val)
-opt_distr = Adam(net_distr)
+opt = Adam(net)
 
 self_play_per_epoch = 60
 
@@ -69,9 +76,7 @@ epochs = 10000
 evaluation_epochs = 100
 evaluation_games = 36
 save_epochs = 100
-old_net_pre = None
-old_net_val = None
-old_net_distr = None
+old_net = None
 
 #fig, ax = plt.subplots(1)
 win_percentages = []
@@ -102,12 +107,7 @@ start = time.time()
 for epoch in range(epochs+1):
     epoch += offset
     if epoch % save_epochs == 0:
-        with open(folder + "ttt_ep_{}.pre.net".format(epoch), "w+") as f:
-            net_pre.toFile(f)
-        with open(folder + "ttt_ep_{}.dist.net".format(epoch), "w+") as f:
-            net_distr.toFile(f)
-        with open(folder + "ttt_ep_{}.val.net".format(epoch), "w+") as f:
-            net_val.toFile(f)
+        net.save(folder + "ttt_ep_{}.heads.net".format(epoch))
     print("Epoch {}".format(epoch), end="\r", flush=True)
     assert self_play_per_epoch % workers == 0
     N = int(self_play_per_epoch / workers)
@@ -123,28 +123,19 @@ for epoch in range(epochs+1):
     print("")"""
     batcher = TwoGoalBatcher(100, memory.get_data())
     for x, y_d, y_v in batcher:
-        intermed = net_pre(x)
-        out_d = net_distr(intermed)
-        out_v = net_val(intermed)
+        out_v, out_d = net(x)
 
         loss_d, delta_d = crit_d(out_d, y_d)
         loss_v, delta_v = crit_v(out_v, y_v)
         loss = loss_d + loss_v
-        delta_inter_d = net_distr.backprop(delta_d)
-        delta_inter_v = net_val.backprop(delta_v)
-        delta_inter = delta_inter_d + delta_inter_v
-        net_pre.backprop(delta_inter)
-
-        opt_pre.take_step()
-        opt_val.take_step()
-        opt_distr.take_step()
+        net.backprop((delta_v, delta_d))
+
+        opt.take_step()
     # Evaluation by self play vs older version:
     if epoch % evaluation_epochs == 0:
-        if old_net_pre is not None:
+        if old_net is not None:
             # now fight
-            player0.net_val = old_net_val
-            player0.net_distr = old_net_distr
-            player0.net_pre = old_net_pre
+            player0.net = old_net
             wins = 0
             assert evaluation_games % workers == 0
             N = int(evaluation_games / workers)
@@ -162,23 +153,16 @@ for epoch in range(epochs+1):
             g.p1 = player1
             if wins/(2 * evaluation_games) >= 0.55:
                 # use the new one
-                player0.net_val = net_val
-                player0.net_pre = net_pre
-                player0.net_distr = net_distr
+                player0.net = net
                 print("Using the new net. Win rate was {:.3f}".format(wins/(2 * evaluation_games)))
             else:
                 # keep the old one
-                net_pre = old_net_pre
-                net_val = old_net_val
-                net_distr = old_net_distr
-                player1.net_val = old_net_val
-                player1.net_distr = old_net_distr
-                player1.net_pre = old_net_pre
+                net = old_net
+                opt = Adam(net)
+                player1.net = old_net
                 print("Keeping the old net. Win rate was {:.3f}".format(wins/(2 * evaluation_games)))
         # save as the new standard
-        old_net_pre = deepcopy(net_pre)
-        old_net_distr = deepcopy(net_distr)
-        old_net_val = deepcopy(net_val)
+        old_net = deepcopy(net)
     print("\t\t\t\t\t loss = {:.6f}".format(sum(loss)/len(loss)), end='\r', flush=True)
 
     # Evaluation and plotting:
@@ -209,11 +193,6 @@ end = time.time()
 time_diff = end-start
 print("Trained for \n\t {} s \n \t {} epochs\n \t {} s/epoch".format(time_diff, epoch+1, time_diff/(epoch+1)))
 
-with open(folder + "ttt.pre.net".format(epoch), "w+") as f:
-    net_pre.toFile(f)
-with open(folder + "ttt.dist.net".format(epoch), "w+") as f:
-    net_distr.toFile(f)
-with open(folder + "ttt.val.net".format(epoch), "w+") as f:
-    net_val.toFile(f)
+net.save(folder + "ttt.heads.net")
 
 #plt.show()